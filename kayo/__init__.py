@@ -7,8 +7,14 @@ import sys
 import aiohttp
 import discord
 import dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+
+from kayo.cache import ResponseCache
+from kayo.fetch import FetchScheduler
+from kayo.storage import create_engines
+from kayo.storage import read_sessionmaker
+from kayo.storage import StorageProfile
+from kayo.storage import write_sessionmaker
+from kayo.worker import IngestWorker
 
 dotenv.load_dotenv()
 LOGLEVEL = os.environ.get('LOGLEVEL').upper()
@@ -32,15 +38,19 @@ class BotContext:
             logging.getLogger("sqlalchemy.engine").setLevel(level=LOGLEVEL)
 
         self.http_client = aiohttp.ClientSession()
+        self.fetcher = FetchScheduler(self.http_client)
+        self.response_cache = ResponseCache()
 
+        profile = StorageProfile.from_env()
         if os.getenv("DEPLOYED") == "production":
-            self.engine = (create_engine("sqlite:///db/kayo.db"))
+            self.engine, self.async_engine, self.async_read_engine = create_engines(profile, "db/kayo.db")
         else:
-            self.engine = (create_engine("sqlite:///:memory:", echo=True))
+            self.engine, self.async_engine, self.async_read_engine = create_engines(profile, echo=True)
 
-        Session = sessionmaker(bind=self.engine)
-        global session
-        self.session = Session()
+        # Session factories, every query helper opens its own short-lived session
+        self.write_session = write_sessionmaker(self.async_engine)
+        self.read_session = read_sessionmaker(self.async_read_engine)
+        self.ingest_worker = IngestWorker(self.engine)
 
         # Initializing core objects
         if os.environ.get('DEPLOYED').upper() == "PRODUCTION":
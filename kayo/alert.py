@@ -8,14 +8,20 @@ from sqlalchemy import delete
 from sqlalchemy import ForeignKey
 from sqlalchemy import select
 from sqlalchemy import UniqueConstraint
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
 from sqlalchemy.orm import relationship
 
 import kayo
+from kayo.db import reader
+from kayo.db import writer
 from kayo.league import League
 from kayo.model import Base
+from kayo.model import max_variables
+from kayo.subscriptions import subscriptions
 from kayo.team import Team
 
 
@@ -30,13 +36,13 @@ class Alert(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True, init=False)
     channel_id: Mapped[int] = mapped_column()
-    league_id: Mapped[int] = mapped_column(ForeignKey("leagues.id"), nullable=True)
-    team_name: Mapped[str] = mapped_column(ForeignKey("teams.name"), nullable=True)
+    league_id: Mapped[int] = mapped_column(ForeignKey("leagues.id"), nullable=True, index=True)
+    team_id: Mapped[int] = mapped_column(ForeignKey("teams.id"), nullable=True, index=True)
 
-    leagues: Mapped[League] = relationship(default=None)
-    teams: Mapped[Team] = relationship(default=None)
+    leagues: Mapped[League] = relationship(init=False, repr=False)
+    teams: Mapped[Team] = relationship(init=False, repr=False)
 
-    __table_args__ = (UniqueConstraint('channel_id', 'league_id', name='channel_league_alert_uc'), UniqueConstraint('channel_id', 'team_name', name='channel_team_alert_uc'))
+    __table_args__ = (UniqueConstraint('channel_id', 'league_id', name='channel_league_alert_uc'), UniqueConstraint('channel_id', 'team_id', name='channel_team_alert_uc'))
 
     def is_team_alert(self):
         """Checks if an alert is for a Team.
@@ -44,10 +50,10 @@ class Alert(Base):
         Returns:
             Boolean: If an alert is for a Team.
         """
-        return self.team_name is not None
+        return self.team_id is not None
 
 
-def create_league_alert(league, channel_id):
+async def create_league_alert(league, channel_id):
     """Creates an Alert to get notifications for a specific League.
 
     Args:
@@ -59,47 +65,50 @@ def create_league_alert(league, channel_id):
     """
     kayo.instance.logger.info(f'Creating an alert for league: {league} in channel id: {channel_id}')
     try:
-        if (a := kayo.instance.session.execute(select(Alert).where(Alert.channel_id == channel_id, Alert.league_id == league.id)).first()) is not None:
-            kayo.instance.logger.info(f'Alert for league {league} already exists, sending the existing Alert object : {a}')
-            return a[0]
-        else:
-            alert = Alert(channel_id=channel_id, league_id=league.id, team_name=None)
-            league.alerts.append(alert)
-            kayo.instance.session.add(alert)
-            kayo.instance.session.commit()
-            kayo.instance.logger.info('Successfully created an alert : {alert} !')
-        return alert
+        async with writer() as session:
+            if (a := (await session.execute(select(Alert).where(Alert.channel_id == channel_id, Alert.league_id == league.id))).first()) is not None:
+                kayo.instance.logger.info(f'Alert for league {league} already exists, sending the existing Alert object : {a}')
+                return a[0]
+            else:
+                alert = Alert(channel_id=channel_id, league_id=league.id, team_id=None)
+                session.add(alert)
+                await session.commit()
+                subscriptions.add(channel_id, league_id=league.id)
+                kayo.instance.logger.info('Successfully created an alert : {alert} !')
+            return alert
     except SQLAlchemyError as e:
         kayo.instance.logger.error(f'Error while creating alert: {str(e)}')
         raise discord.ext.commands.errors.CommandError
 
 
-def get_alerts_teams(team_a, team_b):
+async def get_alerts_teams(team_a_id, team_b_id):
     """Retrieves Alert objects from the database based on the Team the Alert follows.
 
     Args:
-        team_a (str): One of the Team's names facing each other.
-        team_b (str): One of the Team's names facing each other.
+        team_a_id (int): Identifier of one of the Teams facing each other.
+        team_b_id (int): Identifier of one of the Teams facing each other.
 
     Returns:
         List[Alert]: List of alerts
     """
-    return [x[0] for x in kayo.instance.session.execute(select(Alert).where((Alert.team_name == team_a) | (Alert.team_name == team_b))).all()]
+    async with reader() as session:
+        return [x[0] for x in (await session.execute(select(Alert).where((Alert.team_id == team_a_id) | (Alert.team_id == team_b_id)))).all()]
 
 
-def get_alerts_team(team_name):
+async def get_alerts_team(team_id):
     """Get all the Alerts for a specific team.
 
     Args:
-        team_name (str): name of the Team to retrieve alerts from.
+        team_id (int): Identifier of the Team to retrieve alerts from.
 
     Returns:
         List[Alert]: List of all the Alerts.
     """
-    return [x[0] for x in kayo.instance.session.execute(select(Alert).where(Alert.team_name == team_name)).all()]
+    async with reader() as session:
+        return [x[0] for x in (await session.execute(select(Alert).where(Alert.team_id == team_id))).all()]
 
 
-def get_alerts_league(league):
+async def get_alerts_league(league):
     """Retrieves Alert objects from the database based on the League the Alert follows.
 
     Args:
@@ -109,37 +118,119 @@ def get_alerts_league(league):
         List[Alert]: List of alerts
     """
     kayo.instance.logger.info(f'Getting alerts for league {league}')
-    return [x[0] for x in kayo.instance.session.execute(select(Alert).where(Alert.league_id == league.id)).all()]
+    async with reader() as session:
+        return [x[0] for x in (await session.execute(select(Alert).where(Alert.league_id == league.id))).all()]
 
 
-def delete_alert(channel_id, league=None, team=None):
+async def create_alerts(channel_id, leagues=(), teams=()):
+    """Subscribes a channel to many Leagues and Teams in a single transaction.
+
+    The alerts that already exist are left untouched by the unique constraints.
+
+    Args:
+        channel_id (int): Integer representing a single Discord channel.
+        leagues (Iterable[League], optional): The Leagues to follow. Defaults to ().
+        teams (Iterable[Team], optional): The Teams to follow. Defaults to ().
+
+    Returns:
+        int: Number of alerts created.
+    """
+    league_ids, team_ids = [league.id for league in leagues], [team.id for team in teams]
+    created = 0
+    try:
+        async with writer() as session:
+            # Two parameters per row
+            size = max_variables() // 2
+            for column, ids in (("league_id", league_ids), ("team_id", team_ids)):
+                for i in range(0, len(ids), size):
+                    rows = [{"channel_id": channel_id, column: pk} for pk in ids[i: i + size]]
+                    created += (await session.execute(insert(Alert).values(rows).on_conflict_do_nothing())).rowcount
+            await session.commit()
+    except SQLAlchemyError as e:
+        kayo.instance.logger.error(f'Error while creating alerts: {str(e)}')
+        raise discord.ext.commands.errors.CommandError
+    for league_id in league_ids:
+        subscriptions.add(channel_id, league_id=league_id)
+    for team_id in team_ids:
+        subscriptions.add(channel_id, team_id=team_id)
+    kayo.instance.logger.info(f'Created {created} alerts in channel id: {channel_id}')
+    return created
+
+
+async def delete_alert(channel_id, league=None, team=None):
     """Deletes an alert based on the parameters given.
 
     Args:
         channel_id (Integer): Channel ID the command has been issued in
         league (League, optional): The League you would like to delete from alerts. Defaults to None.
-        team_name (str, optional): The Team's name.
+        team (Team, optional): The Team you would like to delete from alerts. Defaults to None.
+    """
+    await delete_alerts(channel_id, leagues=[league] if league is not None else (), teams=[team] if team is not None else ())
+
+
+async def delete_alerts(channel_id, leagues=(), teams=()):
+    """Unsubscribes a channel from many Leagues and Teams in a single transaction.
+
+    Args:
+        channel_id (int): Channel ID the command has been issued in.
+        leagues (Iterable[League], optional): The Leagues to stop following. Defaults to ().
+        teams (Iterable[Team], optional): The Teams to stop following. Defaults to ().
+
+    Returns:
+        int: Number of alerts deleted.
+    """
+    league_ids, team_ids = [league.id for league in leagues], [team.id for team in teams]
+    deleted = 0
+    async with writer() as session:
+        # The channel takes one parameter
+        size = max_variables() - 1
+        for column, ids in ((Alert.league_id, league_ids), (Alert.team_id, team_ids)):
+            for i in range(0, len(ids), size):
+                deleted += (await session.execute(delete(Alert).where(Alert.channel_id == channel_id, column.in_(ids[i: i + size])))).rowcount
+        await session.commit()
+    for league_id in league_ids:
+        subscriptions.discard(channel_id, league_id=league_id)
+    for team_id in team_ids:
+        subscriptions.discard(channel_id, team_id=team_id)
+    return deleted
+
+
+async def delete_alerts_by_channel_ids(channel_ids):
+    """Deletes every alert of channels.
+
+    Args:
+        channel_ids (list[int]): Identifiers of the channels.
+
+    Returns:
+        int: Number of alerts deleted.
     """
-    if league is not None:
-        kayo.instance.session.execute(delete(Alert).where(Alert.channel_id == channel_id, Alert.league_id == league.id))
-    if team is not None:
-        kayo.instance.session.execute(delete(Alert).where(Alert.channel_id == channel_id, Alert.team_name == team.name))
-    kayo.instance.session.commit()
+    deleted = 0
+    async with writer() as session:
+        size = max_variables()
+        for i in range(0, len(channel_ids), size):
+            deleted += (await session.execute(delete(Alert).where(Alert.channel_id.in_(channel_ids[i: i + size])))).rowcount
+        await session.commit()
+    subscriptions.discard_channels(channel_ids)
+    return deleted
 
 
-def get_alerts_by_channel_id(channel_id):
+async def get_alerts_by_channel_id(channel_id):
     """Get all the alerts for a specific channel.
 
     Args:
         channel_id (int): Identifier for the channel.
+
+    Returns:
+        List[Alert]: The alerts of the channel, with their Team loaded.
     """
     try:
-        return [x[0] for x in kayo.instance.session.execute(select(Alert).where(Alert.channel_id == channel_id)).all()]
+        async with reader() as session:
+            return [x[0] for x in (await session.execute(select(Alert).options(joinedload(Alert.teams)).where(Alert.channel_id == channel_id))).all()]
     except SQLAlchemyError as e:
         kayo.instance.logger.error(f'Error while getting an alert from the database: {e}')
 
 
-def get_alerts(ctx: discord.AutocompleteContext = None):
+async def get_alerts(ctx: discord.AutocompleteContext = None):
     """Gets all the alerts from the database.
 
     Args:
@@ -150,12 +241,13 @@ def get_alerts(ctx: discord.AutocompleteContext = None):
         List[Alert]: All the alerts in the database.
     """
     try:
-        return [x[0] for x in kayo.instance.session.execute(select(Alert)).all()]
+        async with reader() as session:
+            return [x[0] for x in (await session.execute(select(Alert))).all()]
     except SQLAlchemyError as e:
         kayo.instance.logger.error(f'Error while getting an alert from the database: {e}')
 
 
-def create_team_alert(team, channel_id):
+async def create_team_alert(team, channel_id):
     """Creates an Alert to get notifications for a specific Team.
 
     Args:
@@ -167,16 +259,27 @@ def create_team_alert(team, channel_id):
     """
     kayo.instance.logger.info(f'Creating an alert for team : {team} in channel id: {channel_id}')
     try:
-        if (a := kayo.instance.session.execute(select(Alert).where(Alert.channel_id == channel_id, Alert.team_name == team.name)).first()) is not None:
-            kayo.instance.logger.info(f'Alert for team {team} already exists, sending the existing Alert object : {a}')
-            return a[0]
-        else:
-            alert = Alert(channel_id=channel_id, team_name=team.name, league_id=None)
-            team.alerts.append(alert)
-            kayo.instance.session.add(alert)
-            kayo.instance.session.commit()
-            kayo.instance.logger.info('Successfully created an alert !')
-        return alert
+        async with writer() as session:
+            if (a := (await session.execute(select(Alert).where(Alert.channel_id == channel_id, Alert.team_id == team.id))).first()) is not None:
+                kayo.instance.logger.info(f'Alert for team {team} already exists, sending the existing Alert object : {a}')
+                return a[0]
+            else:
+                alert = Alert(channel_id=channel_id, team_id=team.id, league_id=None)
+                session.add(alert)
+                await session.commit()
+                subscriptions.add(channel_id, team_id=team.id)
+                kayo.instance.logger.info('Successfully created an alert !')
+            return alert
     except SQLAlchemyError as e:
         kayo.instance.logger.error(f'Error while creating alert: {str(e)}')
         raise discord.ext.commands.errors.CommandError
+
+
+async def load_subscriptions():
+    """Loads the index of the channels following each League and Team, once."""
+    if subscriptions.loaded:
+        return
+    # Plain rows, there can be hundreds of thousands of alerts
+    async with reader() as session:
+        subscriptions.load((await session.execute(select(Alert.channel_id, Alert.league_id, Alert.team_id))).all())
+    kayo.instance.logger.info(f'Loaded {len(subscriptions)} subscriptions')
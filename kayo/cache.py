@@ -0,0 +1,115 @@
+"""Contains the cache used to skip Riot API responses that did not change since the last refresh."""
+import hashlib
+from dataclasses import dataclass
+
+
+@dataclass
+class CacheEntry:
+    """Validators kept for a single cached response.
+
+    Args:
+        etag (str): ETag header sent by the API, if any.
+        last_modified (str): Last-Modified header sent by the API, if any.
+        digest (str): SHA-256 of the response body.
+        size (int): Size of the response body in bytes.
+        meta (dict): Anything the caller needs to remember about the response, like page tokens.
+    """
+
+    etag: str | None
+    last_modified: str | None
+    digest: str
+    size: int
+    meta: dict | None = None
+
+
+class ResponseCache:
+    """Remembers the last processed response for each key (a league id, "leagues"...).
+
+    A response is considered unchanged when the API answers 304 Not Modified to our
+    conditional request, or when the body hashes to the same digest as the last one.
+    """
+
+    def __init__(self):
+        """Creates an empty cache."""
+        self.entries: dict[str, CacheEntry] = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.bytes_saved = 0
+
+    def __repr__(self) -> str:
+        """Formats the counters of the cache.
+
+        Returns:
+            str: Description of self.
+        """
+        return f"ResponseCache(entries={len(self.entries)}, hits={self.hits}, misses={self.misses}, not_modified={self.not_modified}, bytes_saved={self.bytes_saved})"
+
+    def headers(self, key):
+        """Builds the conditional request headers for a key.
+
+        Args:
+            key (str): Identifier of the cached response.
+
+        Returns:
+            dict: If-None-Match / If-Modified-Since headers, empty if nothing is cached.
+        """
+        headers = {}
+        if (entry := self.entries.get(key)) is not None:
+            if entry.etag is not None:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified is not None:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def is_unchanged(self, key, status, body):
+        """Checks if a response is the same as the one last stored for this key.
+
+        Args:
+            key (str): Identifier of the cached response.
+            status (int): HTTP status code of the response.
+            body (bytes): Raw body of the response.
+
+        Returns:
+            bool: True if the response can be skipped.
+        """
+        entry = self.entries.get(key)
+        if entry is not None and status == 304:
+            self.hits += 1
+            self.not_modified += 1
+            self.bytes_saved += entry.size
+            return True
+        if entry is not None and hashlib.sha256(body).hexdigest() == entry.digest:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def meta(self, key):
+        """Gets what the caller stored alongside a response.
+
+        Args:
+            key (str): Identifier of the cached response.
+
+        Returns:
+            dict: The metadata, None if nothing is cached.
+        """
+        if (entry := self.entries.get(key)) is not None:
+            return entry.meta
+
+    def store(self, key, headers, body, meta=None):
+        """Stores a response once it has been processed successfully.
+
+        Args:
+            key (str): Identifier of the cached response.
+            headers (Mapping[str, str]): Headers of the response.
+            body (bytes): Raw body of the response.
+            meta (dict, optional): Metadata to keep alongside the response. Defaults to None.
+        """
+        self.entries[key] = CacheEntry(
+            etag=headers.get("ETag"),
+            last_modified=headers.get("Last-Modified"),
+            digest=hashlib.sha256(body).hexdigest(),
+            size=len(body),
+            meta=meta,
+        )
@@ -0,0 +1,118 @@
+"""Contains the scoping of database sessions to a command invocation or a background task iteration.
+
+Query helpers open their sessions through `reader()` and `writer()`. Inside a scope, the
+helpers called by the same task share one reader and one writer session, closed with the
+scope, so objects never outlive the command or iteration that loaded them and a rollback
+never touches the state of another task. Outside of a scope, every call gets its own session.
+"""
+import asyncio
+import functools
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from kayo import instance
+
+_scope = ContextVar("session_scope", default=None)
+
+
+class SessionScope:
+    """The sessions opened by a task, created on first use.
+
+    Args:
+        task (asyncio.Task): The task owning the scope.
+    """
+
+    def __init__(self, task):
+        """Creates an empty scope."""
+        self.task = task
+        self.read = None
+        self.write = None
+
+    async def close(self):
+        """Closes the sessions opened in the scope, rolling back anything not committed."""
+        for session in (self.read, self.write):
+            if session is not None:
+                await session.close()
+        self.read = self.write = None
+
+
+def _current_scope():
+    # Tasks created inside a scope inherit the context variable, but not the sessions
+    scope = _scope.get()
+    if scope is not None and scope.task is asyncio.current_task():
+        return scope
+
+
+@asynccontextmanager
+async def session_scope():
+    """Opens a scope for the current task.
+
+    Yields:
+        SessionScope: The scope.
+    """
+    scope = SessionScope(asyncio.current_task())
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+        await scope.close()
+
+
+def scoped(function):
+    """Runs each call of a coroutine function in its own session scope.
+
+    Args:
+        function (Callable): A command callback or a background task.
+
+    Returns:
+        Callable: The wrapped coroutine function.
+    """
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        async with session_scope():
+            return await function(*args, **kwargs)
+
+    return wrapper
+
+
+@asynccontextmanager
+async def reader():
+    """Gets a session on the reader engine.
+
+    Yields:
+        AsyncSession: The session of the current scope, or a new one closed on exit.
+    """
+    if (scope := _current_scope()) is None:
+        async with instance.read_session() as session:
+            yield session
+    else:
+        if scope.read is None:
+            scope.read = instance.read_session()
+        try:
+            yield scope.read
+        finally:
+            # Ends the read transaction so the next helper sees the latest writes, the
+            # loaded objects are kept as the sessions never expire them
+            await scope.read.commit()
+
+
+@asynccontextmanager
+async def writer():
+    """Gets a session on the writer engine.
+
+    Yields:
+        AsyncSession: The session of the current scope, or a new one closed on exit.
+    """
+    if (scope := _current_scope()) is None:
+        async with instance.write_session() as session:
+            yield session
+    else:
+        if scope.write is None:
+            scope.write = instance.write_session()
+        try:
+            yield scope.write
+        except BaseException:
+            # Leave the session usable by the next helper of the scope
+            await scope.write.rollback()
+            raise
@@ -0,0 +1,145 @@
+"""Contains the planning of the alerts to send for upcoming matches."""
+import os
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload
+
+from kayo import instance
+from kayo.alert import delete_alerts_by_channel_ids
+from kayo.db import reader
+from kayo.ledger import claim_deliveries
+from kayo.ledger import FAILED
+from kayo.ledger import LedgerEntry
+from kayo.ledger import record_deliveries
+from kayo.ledger import SENT
+from kayo.lib import embed_cache
+from kayo.lib import post_alerts
+from kayo.match import Match
+from kayo.outbox import DeliveryQueue
+from kayo.subscriptions import subscriptions
+
+DEAD_CHANNEL_THRESHOLD = int(os.getenv("DEAD_CHANNEL_THRESHOLD", "3"))
+
+# Limits of a single Discord message
+MESSAGE_MAX_EMBEDS = 10
+MESSAGE_MAX_CHARACTERS = 6000
+
+
+@dataclass(frozen=True)
+class Delivery:
+    """An alert to send: a Match, to a channel.
+
+    Args:
+        match (Match): The Match, with its League and Teams loaded.
+        channel_id (int): Discord channel the alert is sent to.
+    """
+
+    match: Match
+    channel_id: int
+
+
+async def get_deliveries(match_ids, due_only=False):
+    """Resolves every channel following the League or one of the Teams of matches.
+
+    The channels come from the subscription index, a channel following several of them
+    only gets the match once.
+
+    Args:
+        match_ids (list[int]): Ids of the matches.
+        due_only (bool, optional): Skips the deliveries the ledger has already handled. Defaults to False.
+
+    Returns:
+        list[Delivery]: The alerts to send.
+    """
+    query = select(Match).where(Match.id.in_(match_ids)).options(joinedload(Match.league), joinedload(Match.team_a), joinedload(Match.team_b))
+    entries = {}
+    try:
+        async with reader() as session:
+            matches = (await session.scalars(query)).all()
+            if due_only:
+                ledger = await session.scalars(select(LedgerEntry).where(LedgerEntry.match_id.in_(match_ids)))
+                entries = {(entry.match_id, entry.channel_id): entry for entry in ledger}
+    except SQLAlchemyError as e:
+        instance.logger.error(f'Error while planning the alerts from the database: {e}')
+        return []
+    now = int(time.time())
+    deliveries = []
+    for match in matches:
+        for channel_id in subscriptions.channels(match):
+            if (entry := entries.get((match.id, channel_id))) is None or entry.is_due(match.startTime, now):
+                deliveries.append(Delivery(match, channel_id))
+    return deliveries
+
+
+async def pack(deliveries):
+    """Groups the alerts of a channel in as few messages as Discord allows.
+
+    Args:
+        deliveries (list[Delivery]): The alerts of a single channel.
+
+    Returns:
+        list[list[tuple[Delivery, discord.Embed]]]: The alerts of each message, with their embeds.
+    """
+    messages, current, size = [], [], 0
+    for delivery in sorted(deliveries, key=lambda d: d.match.startTime):
+        embed = await embed_cache.get(delivery.match)
+        if current and (len(current) == MESSAGE_MAX_EMBEDS or size + len(embed) > MESSAGE_MAX_CHARACTERS):
+            messages.append(current)
+            current, size = [], 0
+        current.append((delivery, embed))
+        size += len(embed)
+    if current:
+        messages.append(current)
+    return messages
+
+
+async def deliver(deliveries, ledger=True):
+    """Sends alerts through the delivery queue, one message per channel when possible, recording them in the ledger.
+
+    Args:
+        deliveries (list[Delivery]): The alerts to send.
+        ledger (bool, optional): Records the deliveries in the ledger. Defaults to True.
+
+    Returns:
+        list[Delivery]: The deliveries that failed.
+    """
+    if ledger:
+        await claim_deliveries(deliveries)
+    by_channel = {}
+    for delivery in deliveries:
+        by_channel.setdefault(delivery.channel_id, []).append(delivery)
+    messages = [message for channel_deliveries in by_channel.values() for message in await pack(channel_deliveries)]
+    results = await outbox.submit([(message[0][0].channel_id, [embed for _, embed in message]) for message in messages])
+    sent = [delivery for message, ok in zip(messages, results) if ok for delivery, _ in message]
+    failed = [delivery for message, ok in zip(messages, results) if not ok for delivery, _ in message]
+    if ledger:
+        await record_deliveries(sent, SENT)
+        await record_deliveries(failed, FAILED)
+    instance.logger.info(f'Delivered {len(sent)} alerts in {len(messages)} messages, {len(failed)} failed, {outbox}')
+    if dead := outbox.dead_channels(DEAD_CHANNEL_THRESHOLD):
+        await prune_channels(dead)
+    return failed
+
+
+async def prune_channels(channel_ids):
+    """Deletes the alerts of channels the bot cannot reach anymore.
+
+    Args:
+        channel_ids (list[int]): Identifiers of the channels.
+
+    Returns:
+        int: Number of alerts deleted.
+    """
+    try:
+        deleted = await delete_alerts_by_channel_ids(channel_ids)
+    except SQLAlchemyError as e:
+        instance.logger.error(f'Error while pruning dead channels: {e}')
+        return 0
+    instance.logger.warning(f'Pruned {len(channel_ids)} unreachable channels and their {deleted} alerts: {channel_ids}')
+    return deleted
+
+
+outbox = DeliveryQueue(post_alerts)
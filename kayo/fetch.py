@@ -0,0 +1,97 @@
+"""Contains the scheduler used for every request sent to the Riot API."""
+import asyncio
+import os
+import random
+from dataclasses import dataclass
+
+import aiohttp
+
+from kayo.ratelimit import TokenBucket
+
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "4"))
+FETCH_RATE = float(os.getenv("FETCH_RATE", "5"))
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "15"))
+FETCH_RETRIES = int(os.getenv("FETCH_RETRIES", "3"))
+FETCH_BACKOFF = float(os.getenv("FETCH_BACKOFF", "1"))
+
+
+class FetchError(Exception):
+    """Raised when a request still fails after all its retries."""
+
+    pass
+
+
+@dataclass
+class FetchResult:
+    """A response read entirely from the Riot API.
+
+    Args:
+        status (int): HTTP status code.
+        headers (Mapping[str, str]): Headers of the response.
+        body (bytes): Raw body of the response.
+    """
+
+    status: int
+    headers: dict
+    body: bytes
+
+
+class FetchScheduler:
+    """Sends GET requests with a concurrency cap, a rate limit, timeouts and retries.
+
+    Args:
+        http_client (aiohttp.ClientSession): Session used to send the requests.
+        concurrency (int): Maximum number of requests in flight.
+        rate (float): Maximum number of requests started per second.
+        timeout (float): Timeout of a single attempt, in seconds.
+        retries (int): Number of retries after the first attempt.
+        backoff (float): Base delay of the exponential backoff, in seconds.
+    """
+
+    def __init__(self, http_client, concurrency=FETCH_CONCURRENCY, rate=FETCH_RATE, timeout=FETCH_TIMEOUT, retries=FETCH_RETRIES, backoff=FETCH_BACKOFF):
+        """Creates the scheduler."""
+        self.http_client = http_client
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate, capacity=max(1, concurrency))
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+
+    async def get(self, url, headers=None):
+        """Sends a GET request, retrying on network errors, timeouts, 429 and 5xx responses.
+
+        Args:
+            url (str): URL to request.
+            headers (dict, optional): Headers of the request. Defaults to None.
+
+        Raises:
+            FetchError: If the request failed on every attempt, or was rejected by the API.
+
+        Returns:
+            FetchResult: The response.
+        """
+        error = None
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            await self.bucket.acquire()
+            try:
+                async with self.semaphore:
+                    async with self.http_client.get(url, headers=headers, timeout=self.timeout) as response:
+                        result = FetchResult(response.status, response.headers, await response.read())
+                if result.status == 429 or result.status >= 500:
+                    error = f'status {result.status}'
+                    retry_after = result.headers.get("Retry-After")
+                elif result.status >= 400:
+                    raise FetchError(f'{url} answered with status {result.status}: {result.body[:200]}')
+                else:
+                    return result
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+            if attempt < self.retries:
+                try:
+                    delay = float(retry_after)
+                except (TypeError, ValueError):
+                    # Full jitter, so retries of different leagues do not line up
+                    delay = random.uniform(0, self.backoff * 2 ** attempt)
+                await asyncio.sleep(delay)
+        raise FetchError(f'{url} failed after {self.retries + 1} attempts: {error}')
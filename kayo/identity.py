@@ -0,0 +1,58 @@
+"""Contains the in-memory cache used to look Leagues and Teams up without reading the database."""
+
+
+class IdentityCache:
+    """Objects of a table, by each of their unique columns.
+
+    Lookups read through: a miss is read from the database by the caller and added to the
+    cache. Each dict operation is atomic, so the ingest worker can refresh the cache while
+    the event loop reads it.
+
+    Args:
+        keys (str): Unique columns the objects are looked up by, the primary key first.
+    """
+
+    def __init__(self, *keys):
+        """Creates an empty cache."""
+        self.keys = keys
+        self.objects: dict[str, dict] = {key: {} for key in keys}
+
+    def __len__(self) -> int:
+        """Counts the objects.
+
+        Returns:
+            int: Number of objects in the cache.
+        """
+        return len(self.objects[self.keys[0]])
+
+    def get(self, key, value):
+        """Looks an object up.
+
+        Args:
+            key (str): Unique column to look the object up by.
+            value (Any): Value of the column.
+
+        Returns:
+            kayo.model.Base: The object, None if it is not cached.
+        """
+        return self.objects[key].get(value)
+
+    def update(self, objects):
+        """Adds objects, or replaces the cached objects with the same primary key.
+
+        Args:
+            objects (Iterable[kayo.model.Base]): Objects that have just been read or stored.
+        """
+        primary_key = self.keys[0]
+        for obj in objects:
+            if (cached := self.objects[primary_key].get(getattr(obj, primary_key))) is not None:
+                # A renamed object must not be found by its old name anymore
+                for key in self.keys[1:]:
+                    if self.objects[key].get(getattr(cached, key)) is cached:
+                        self.objects[key].pop(getattr(cached, key), None)
+            for key in self.keys:
+                self.objects[key][getattr(obj, key)] = obj
+
+
+league_cache = IdentityCache("id", "name", "slug")
+team_cache = IdentityCache("id", "name")
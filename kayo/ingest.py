@@ -0,0 +1,333 @@
+"""Contains the objects used to turn a refresh of the Riot API into database writes."""
+import calendar
+import json
+import time
+from dataclasses import dataclass
+from dataclasses import field
+
+from sqlalchemy import select
+
+from kayo.identity import team_cache
+from kayo.match import archive_matches
+from kayo.match import delete_matches
+from kayo.match import Match
+from kayo.match import upsert_matches
+from kayo.names import team_names
+from kayo.schedule import upsert_schedule_cursors
+from kayo.team import get_team_ids
+from kayo.team import Team
+from kayo.team import upsert_teams
+
+
+class TeamRegistry:
+    """Canonical Team objects of a refresh, one per team name.
+
+    The same team plays dozens of matches, it is only mapped the first time it is seen.
+    """
+
+    columns = [column.name for column in Team.__table__.columns if not column.primary_key]
+
+    def __init__(self):
+        """Creates an empty registry."""
+        self.teams: dict[str, Team] = {}
+
+    def __len__(self) -> int:
+        """Counts the teams registered.
+
+        Returns:
+            int: Number of distinct teams.
+        """
+        return len(self.teams)
+
+    def __iter__(self):
+        """Iterates over the registered teams.
+
+        Returns:
+            Iterator[Team]: The canonical Team objects.
+        """
+        return iter(self.teams.values())
+
+    def add(self, payload):
+        """Registers a team found in an event of the schedule.
+
+        Args:
+            payload (dict): The team, as sent by the Riot API.
+
+        Returns:
+            Team: The canonical Team object for this name.
+        """
+        if (team := self.teams.get(payload["name"])) is None:
+            team = Team(**{k: payload[k] for k in self.columns if k in payload})
+            self.teams[team.name] = team
+        return team
+
+
+@dataclass
+class RefreshBatch:
+    """Everything gathered from the Riot API during one refresh.
+
+    Args:
+        teams (TeamRegistry): Teams found in the parsed pages.
+        matches (list[Match]): Matches found in the parsed pages.
+        cursors (list[ScheduleCursor]): Schedule cursors to save.
+        responses (dict): Responses to store in the cache once the batch is saved.
+        stale (list[int]): Ids of the matches removed from the schedule, see stale_matches().
+    """
+
+    teams: TeamRegistry = field(default_factory=TeamRegistry)
+    matches: list = field(default_factory=list)
+    cursors: list = field(default_factory=list)
+    responses: dict = field(default_factory=dict)
+    stale: list = field(default_factory=list)
+
+
+@dataclass
+class ChangeSet:
+    """Rows that differ between a fetch and the database.
+
+    Args:
+        inserted (list): Objects that are not in the database yet.
+        updated (list): Objects whose columns changed.
+        deleted (list): Primary keys of the rows to delete.
+    """
+
+    inserted: list = field(default_factory=list)
+    updated: list = field(default_factory=list)
+    deleted: list = field(default_factory=list)
+
+    def __repr__(self) -> str:
+        """Formats the counts of the change set.
+
+        Returns:
+            str: Description of self.
+        """
+        return f"+{len(self.inserted)} ~{len(self.updated)} -{len(self.deleted)}"
+
+    @property
+    def upserts(self):
+        """Objects to write to the database.
+
+        Returns:
+            list: Inserted and updated objects.
+        """
+        return self.inserted + self.updated
+
+
+class Snapshot:
+    """In-memory copy of the columns of a table, used to only write rows that changed.
+
+    Args:
+        model (kayo.model.Base): Mapped class of the table.
+        key (str, optional): Unique column identifying a row. Defaults to None, for the
+        primary key. A primary key that is not the key is generated by the database and
+        left out of the snapshot.
+    """
+
+    def __init__(self, model, key=None):
+        """Creates an empty snapshot, loaded from the database on first use."""
+        self.table = model.__table__
+        self.key = key or self.table.primary_key.columns.values()[0].name
+        self.columns = [column.name for column in self.table.columns if not column.primary_key or column.name == self.key]
+        self.rows = None
+
+    def normalize(self, column, value):
+        """Converts a value to what the database gives back for this column.
+
+        Args:
+            column (str): Name of the column.
+            value (Any): Value fetched from the API.
+
+        Returns:
+            Any: The value, as read from the database.
+        """
+        if value is None:
+            return None
+        return self.table.columns[column].type.python_type(value)
+
+    def fingerprint(self, obj):
+        """Gets the values of all the columns of an object.
+
+        Args:
+            obj (kayo.model.Base): Object to fingerprint.
+
+        Returns:
+            tuple: Normalized values of all the columns.
+        """
+        return tuple(self.normalize(column, getattr(obj, column)) for column in self.columns)
+
+    def load(self, session):
+        """Reads the whole table if the snapshot is not loaded yet.
+
+        Args:
+            session (sqlalchemy.orm.Session): Session used to read the table.
+        """
+        if self.rows is None:
+            key = self.columns.index(self.key)
+            self.rows = {tuple(row)[key]: tuple(row) for row in session.execute(select(*(self.table.columns[column] for column in self.columns)))}
+
+    def diff(self, session, objects, stale=()):
+        """Compares fetched objects with the database.
+
+        Args:
+            session (sqlalchemy.orm.Session): Session used to load the snapshot.
+            objects (list): Fetched objects, the last one wins if a key appears twice.
+            stale (Iterable, optional): Keys that must be deleted if they were not fetched. Defaults to ().
+
+        Returns:
+            ChangeSet: What must be written to the database.
+        """
+        self.load(session)
+        key = self.columns.index(self.key)
+        fetched = {}
+        for obj in objects:
+            fingerprint = self.fingerprint(obj)
+            fetched[fingerprint[key]] = (obj, fingerprint)
+
+        changes = ChangeSet()
+        for pk, (obj, fingerprint) in fetched.items():
+            if (stored := self.rows.get(pk)) is None:
+                changes.inserted.append(obj)
+            elif stored != fingerprint:
+                changes.updated.append(obj)
+        changes.deleted = [pk for pk in stale if pk not in fetched and pk in self.rows]
+        return changes
+
+    def apply(self, changes):
+        """Updates the snapshot once a change set has been written.
+
+        Args:
+            changes (ChangeSet): The change set written to the database.
+        """
+        for obj in changes.upserts:
+            fingerprint = self.fingerprint(obj)
+            self.rows[fingerprint[self.columns.index(self.key)]] = fingerprint
+        for pk in changes.deleted:
+            self.rows.pop(pk, None)
+
+    def invalidate(self):
+        """Forgets the snapshot, it will be read again on next use."""
+        self.rows = None
+
+
+team_snapshot = Snapshot(Team, key="name")
+match_snapshot = Snapshot(Match)
+
+
+def stale_matches(batch: RefreshBatch, cache):
+    """Gets the matches removed from the schedule, according to the pages parsed again.
+
+    A match is only removed when the page it was last seen on no longer lists it, and
+    no other page does. Nothing is removed for a page the cache knows nothing about.
+
+    Args:
+        batch (RefreshBatch): What has been fetched.
+        cache (kayo.cache.ResponseCache): The responses of the previous refreshes, with the
+        ids of the matches of each page in their metadata.
+
+    Returns:
+        list[int]: Ids of the matches to delete.
+    """
+    stale = set()
+    for key in batch.responses:
+        stale.update((cache.meta(key) or {}).get("matches", ()))
+    stale.difference_update(match.id for match in batch.matches)
+    if stale:
+        for key, entry in cache.entries.items():
+            if key not in batch.responses and entry.meta:
+                stale.difference_update(entry.meta.get("matches", ()))
+    return sorted(stale)
+
+
+def parse_schedule_page(league_id, body, batch: RefreshBatch):
+    """Gathers the teams and matches of a getSchedule response. Runs on the ingest worker.
+
+    Args:
+        league_id (int): Identifier of the League the page belongs to.
+        body (bytes): Raw body of the response.
+        batch (RefreshBatch): Where the rows are gathered.
+
+    Returns:
+        dict: The older and newer page tokens of the page, and the ids of its matches.
+    """
+    schedule = json.loads(body)["data"]["schedule"]
+    list_of_matches = []
+    # Going through all the teams in the upcoming events
+    for i in schedule["events"]:
+        # Registering both teams, only the first occurrence of a team is mapped
+        team_a = batch.teams.add(i["match"]["teams"][0])
+        team_b = batch.teams.add(i["match"]["teams"][1])
+
+        match_dict = i["match"]
+        match = Match(
+            id=int(match_dict["id"]),
+            league_id=league_id,
+            startTime=calendar.timegm(time.strptime(i["startTime"], "%Y-%m-%dT%H:%M:%SZ")),
+            bo_count=i["match"]["strategy"]["count"],
+            blockName=i["blockName"],
+            # The identifiers of new teams are only known once they are stored
+            team_a=team_a,
+            team_b=team_b,
+        )
+        list_of_matches.append(match)
+    batch.matches.extend(list_of_matches)
+    pages = {k: v for k, v in schedule.get("pages", {}).items() if k in ("older", "newer")}
+    return {**pages, "matches": [match.id for match in list_of_matches]}
+
+
+def store_batch(session, batch: RefreshBatch):
+    """Writes the rows of a refresh that changed to the database. Runs on the ingest worker.
+
+    Args:
+        session (sqlalchemy.orm.Session): Session used for the writes.
+        batch (RefreshBatch): What has been fetched.
+
+    Returns:
+        dict[str, ChangeSet]: The changes written, by table.
+    """
+    teams = team_snapshot.diff(session, batch.teams)
+    try:
+        upsert_teams(session, teams.upserts)
+        team_ids = get_team_ids(session, [team.name for team in batch.teams])
+        for match in batch.matches:
+            match.team_a_id, match.team_b_id = team_ids[match.team_a.name], team_ids[match.team_b.name]
+        matches = match_snapshot.diff(session, batch.matches, stale=batch.stale)
+        upsert_matches(session, matches.upserts)
+        delete_matches(session, matches.deleted)
+        upsert_schedule_cursors(session, batch.cursors)
+        session.commit()
+    except Exception:
+        # Part of the batch may have been written, the snapshots cannot be trusted anymore
+        team_snapshot.invalidate()
+        match_snapshot.invalidate()
+        raise
+    team_snapshot.apply(teams)
+    match_snapshot.apply(matches)
+    for team in teams.upserts:
+        team.id = team_ids[team.name]
+    team_cache.update(teams.upserts)
+    # Teams are never renamed, only new names need a rebuild of the index
+    if teams.inserted and team_names.loaded:
+        team_names.rebuild(team_names.names.union(team.name for team in teams.inserted))
+    return {"teams": teams, "matches": matches}
+
+
+def archive_batch(session, cutoff, limit):
+    """Moves a batch of old matches to the archive. Runs on the ingest worker.
+
+    Args:
+        session (sqlalchemy.orm.Session): Session used for the writes.
+        cutoff (int): UTC epoch before which matches are archived.
+        limit (int): Maximum number of matches moved.
+
+    Returns:
+        int: Number of archived matches.
+    """
+    try:
+        changes = ChangeSet(deleted=archive_matches(session, cutoff, limit))
+        session.commit()
+    except Exception:
+        match_snapshot.invalidate()
+        raise
+    if match_snapshot.rows is not None:
+        match_snapshot.apply(changes)
+    return len(changes.deleted)
@@ -1,18 +1,22 @@
 """Contains the dataclass and all useful function to interact with Leagues."""
+import json
 import os
 
 import discord
-import requests
 from sqlalchemy import select
 from sqlalchemy import String
-from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
 from sqlalchemy.orm import relationship
 
 import kayo
+from kayo.db import reader
+from kayo.fetch import FetchError
+from kayo.identity import league_cache
 from kayo.model import Base
+from kayo.model import upsert
+from kayo.names import league_names
 
 
 class League(Base):
@@ -30,7 +34,7 @@ class League(Base):
     region: Mapped[str] = mapped_column(String(60))
     image: Mapped[str] = mapped_column(String(500))
     alerts: Mapped[list["kayo.alert.Alert"]] = relationship(
-        default_factory=list, back_populates="leagues"
+        default_factory=list, back_populates="leagues", repr=False
     )
 
     def __repr__(self) -> str:
@@ -42,19 +46,47 @@ class League(Base):
         return f"League(id={self.id!r}, name={self.name!r}, slug={self.slug!r}), region={self.region!r})"
 
 
-def get_league_names(ctx: discord.AutocompleteContext = None):
-    """Gets a list of all the League names currently in the database.
+async def get_league_names(ctx: discord.AutocompleteContext = None):
+    """Gets the League names from the in-memory index.
 
     Args:
         ctx (discord.AutocompleteContext, optional): Used when called from autocompletion. Defaults to None.
 
     Returns:
-        List[str]: List of League names.
+        List[str]: The best matching League names when autocompleting, all of them otherwise.
     """
-    return [league.name for league in get_leagues()]
+    await load_league_names()
+    if ctx is None:
+        return league_names.all()
+    return league_names.search(ctx.value)
 
 
-def get_league_by_id(league_id):
+async def load_league_names():
+    """Loads the index of the League names, once."""
+    if league_names.loaded:
+        return
+    async with reader() as session:
+        league_names.rebuild((await session.execute(select(League.name))).scalars())
+
+
+async def _get_league(key, value):
+    """Returns a League object from the cache, read from the database on a miss.
+
+    Args:
+        key (str): Unique column to look the League up by.
+        value (Any): Value of the column.
+
+    Returns:
+        League: A single League object.
+    """
+    if (league := league_cache.get(key, value)) is None:
+        async with reader() as session:
+            league = (await session.execute(select(League).where(getattr(League, key) == value))).one()[0]
+        league_cache.update([league])
+    return league
+
+
+async def get_league_by_id(league_id):
     """Returns a League object based on its slug.
 
     Args:
@@ -64,12 +96,12 @@ def get_league_by_id(league_id):
         League: A single League object.
     """
     try:
-        return kayo.instance.session.execute(select(League).where(League.id == league_id)).one()[0]
+        return await _get_league("id", league_id)
     except SQLAlchemyError as e:
         kayo.instance.logger.error(f'Error while getting a league from the database: {e}')
 
 
-def get_league_by_name(league_name):
+async def get_league_by_name(league_name):
     """Returns a League object based on its slug.
 
     Args:
@@ -79,12 +111,12 @@ def get_league_by_name(league_name):
         League: A single League object.
     """
     try:
-        return kayo.instance.session.execute(select(League).where(League.name == league_name)).one()[0]
+        return await _get_league("name", league_name)
     except SQLAlchemyError as e:
         kayo.instance.logger.error(f'Error while getting a league from the database: {e}')
 
 
-def get_league_by_slug(league_slug):
+async def get_league_by_slug(league_slug):
     """Returns a League object based on its slug.
 
     Args:
@@ -94,12 +126,12 @@ def get_league_by_slug(league_slug):
         League: A single League object.
     """
     try:
-        return kayo.instance.session.execute(select(League).where(League.slug == league_slug)).one()[0]
+        return await _get_league("slug", league_slug)
     except SQLAlchemyError as e:
         kayo.instance.logger.error(f'Error while getting a league from the database: {e}')
 
 
-def get_leagues(ctx: discord.AutocompleteContext = None):
+async def get_leagues(ctx: discord.AutocompleteContext = None):
     """Gets all the leagues currently in the database.
 
     Args:
@@ -110,64 +142,68 @@ def get_leagues(ctx: discord.AutocompleteContext = None):
         List[League]: The list of leagues.
     """
     try:
-        kayo.instance.logger.info('Getting all the leagues from DB...')
-        return [x[0] for x in kayo.instance.session.execute(select(League)).all()]
+        async with reader() as session:
+            return [x[0] for x in (await session.execute(select(League))).all()]
     except SQLAlchemyError as e:
         kayo.instance.logger.error(f'Error while getting leagues from the database: {e}')
 
 
-def upsert_leagues(leagues: list[League]):
-    """Upserts leagues.
+def upsert_leagues(session, leagues: list[League]):
+    """Upserts leagues, the caller commits.
 
     Args:
+        session (sqlalchemy.orm.Session): Session used for the writes.
         leagues (list[League]): Leagues to upsert.
     """
-    # https://www.sqlite.org/limits.html#max_variable_number
-    for i in range(0, len(leagues), 100):
-        stmt = insert(League).values(
-            [
-                {
-                    "id": league.id,
-                    "name": league.name,
-                    "slug": league.slug,
-                    "region": league.region,
-                    "image": league.image
-                }
-                for league in leagues[
-                    i: i + 100
-                    if i + 100 < len(leagues)
-                    else len(leagues)
-                ]
-            ]
-        )
-        stmt = stmt.on_conflict_do_update(
-            index_elements=["id"],
-            set_={
-                "name": stmt.excluded.name,
-                "slug": stmt.excluded.slug,
-                "region": stmt.excluded.region,
-                "image": stmt.excluded.image
-            },
-        )
-        kayo.instance.session.execute(stmt)
-    kayo.instance.session.commit()
-
-
-def fetch_leagues():
-    """Downloads all the leagues and inserts them in the database."""
+    upsert(session, League, leagues)
+
+
+def store_leagues(session, body):
+    """Parses a getLeagues response and upserts the leagues. Runs on the ingest worker.
+
+    Args:
+        session (sqlalchemy.orm.Session): Session used for the writes.
+        body (bytes): Raw body of the response.
+
+    Returns:
+        List[League]: The leagues of the response.
+    """
+    columns = [column.name for column in League.__table__.columns]
+    list_of_leagues = [League(**{k: league_dict[k] for k in columns if k in league_dict}) for league_dict in json.loads(body)["data"]["leagues"]]
+    upsert_leagues(session, list_of_leagues)
+    session.commit()
+    # The ids of the API are strings, the leagues are read back to cache them as stored
+    stored = session.execute(select(League)).scalars().all()
+    league_cache.update(stored)
+    # A renamed League keeps its id, the index is rebuilt from the table
+    if not league_names.covers(league.name for league in stored):
+        league_names.rebuild(league.name for league in stored)
+    return list_of_leagues
+
+
+async def fetch_leagues():
+    """Downloads all the leagues and inserts them in the database.
+
+    Returns:
+        List[League]: The leagues returned by the Riot API, empty if the call failed
+        or if they did not change since the last refresh.
+    """
     # The league endpoint
     kayo.instance.logger.info('Fetching Leagues...')
     url = "https://esports-api.service.valorantesports.com/persisted/val/getLeagues?hl=en-US&sport=val"
     try:
-        payload = {"X-Api-Key": os.getenv("RIOT_API_KEY")}
-        response = requests.get(url, headers=payload)
-        data = response.json()["data"]["leagues"]
-        list_of_leagues = []
-        for league_dict in data:
-            league = League(**{k: league_dict[k] for k in dir(League) if k in league_dict})
-            list_of_leagues.append(league)
-        upsert_leagues(list_of_leagues)
-    except requests.RequestException as e:
+        payload = {"X-Api-Key": os.getenv("RIOT_API_KEY"), **kayo.instance.response_cache.headers("leagues")}
+        response = await kayo.instance.fetcher.get(url, headers=payload)
+        if kayo.instance.response_cache.is_unchanged("leagues", response.status, response.body):
+            kayo.instance.logger.info('Leagues did not change since the last refresh.')
+            return []
+        list_of_leagues = await kayo.instance.ingest_worker.transaction(store_leagues, response.body)
+        kayo.instance.response_cache.store("leagues", response.headers, response.body)
+        return list_of_leagues
+    except FetchError as e:
         kayo.instance.logger.error(f'Error while fetching the leagues: {e}')
+    except (KeyError, ValueError) as e:
+        kayo.instance.logger.error(f'Error while parsing the leagues: {e}')
     except SQLAlchemyError as e:
         kayo.instance.logger.error(f'Error while inserting leagues into the database: {e}')
+    return []
@@ -0,0 +1,125 @@
+"""Contains the ledger of the alerts sent, so a Match is only alerted once in each channel."""
+import os
+import time
+
+from sqlalchemy import case
+from sqlalchemy import ForeignKey
+from sqlalchemy import String
+from sqlalchemy import tuple_
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Mapped
+from sqlalchemy.orm import mapped_column
+
+from kayo import instance
+from kayo.db import writer
+from kayo.model import Base
+from kayo.model import max_variables
+
+DELIVERY_MAX_ATTEMPTS = int(os.getenv("DELIVERY_MAX_ATTEMPTS", "3"))
+DELIVERY_PENDING_TIMEOUT = int(os.getenv("DELIVERY_PENDING_TIMEOUT", "120"))
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+
+class LedgerEntry(Base):
+    """State of the alert of a Match in a channel.
+
+    An entry is claimed as pending before the alert is sent, then marked as sent or
+    failed. A pending entry older than DELIVERY_PENDING_TIMEOUT was interrupted by a
+    restart and is sent again. The entry is for a given start time, a postponed Match
+    is alerted again.
+
+    Args:
+        kayo.model.Base: Base class.
+    """
+
+    __tablename__ = "deliveries"
+
+    match_id: Mapped[int] = mapped_column(ForeignKey("matches.id"), primary_key=True)
+    channel_id: Mapped[int] = mapped_column(primary_key=True)
+    # startTime of the Match the alert was sent for
+    startTime: Mapped[int] = mapped_column()
+    status: Mapped[str] = mapped_column(String(10))
+    attempts: Mapped[int] = mapped_column(default=0)
+    # UTC epoch, in seconds
+    updated_at: Mapped[int] = mapped_column(default=0)
+
+    def is_due(self, start_time, now):
+        """Checks if the alert must be sent (again).
+
+        Args:
+            start_time (int): Current start time of the Match.
+            now (int): Current UTC epoch.
+
+        Returns:
+            bool: True when the entry is for another start time, or when it failed or has
+            been pending for too long, with attempts left.
+        """
+        if self.startTime != start_time:
+            return True
+        if self.attempts >= DELIVERY_MAX_ATTEMPTS:
+            return False
+        return self.status == FAILED or (self.status == PENDING and self.updated_at < now - DELIVERY_PENDING_TIMEOUT)
+
+
+async def claim_deliveries(deliveries):
+    """Marks deliveries as pending before they are sent, counting an attempt.
+
+    Args:
+        deliveries (list[Delivery]): The alerts about to be sent.
+    """
+    if not deliveries:
+        return
+    now = int(time.time())
+    stmt = insert(LedgerEntry)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["match_id", "channel_id"],
+        set_={
+            "status": PENDING,
+            # The attempts of a previous start time do not count
+            "attempts": case((LedgerEntry.startTime == stmt.excluded.startTime, LedgerEntry.attempts + 1), else_=1),
+            "startTime": stmt.excluded.startTime,
+            "updated_at": now,
+        },
+    )
+    rows = [
+        {"match_id": d.match.id, "channel_id": d.channel_id, "startTime": d.match.startTime, "status": PENDING, "attempts": 1, "updated_at": now}
+        for d in deliveries
+    ]
+    try:
+        async with writer() as session:
+            await session.execute(stmt, rows)
+            await session.commit()
+    except SQLAlchemyError as e:
+        instance.logger.error(f'Error while claiming deliveries: {e}')
+        raise
+
+
+async def record_deliveries(deliveries, status):
+    """Records the outcome of deliveries.
+
+    Args:
+        deliveries (list[Delivery]): The alerts sent, or that failed.
+        status (str): SENT or FAILED.
+    """
+    if not deliveries:
+        return
+    keys = [(d.match.id, d.channel_id) for d in deliveries]
+    now = int(time.time())
+    try:
+        async with writer() as session:
+            # Two parameters per delivery
+            size = max_variables() // 2
+            for i in range(0, len(keys), size):
+                await session.execute(
+                    update(LedgerEntry)
+                    .where(tuple_(LedgerEntry.match_id, LedgerEntry.channel_id).in_(keys[i: i + size]))
+                    .values(status=status, updated_at=now)
+                )
+            await session.commit()
+    except SQLAlchemyError as e:
+        instance.logger.error(f'Error while recording {status} deliveries: {e}')
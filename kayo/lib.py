@@ -2,82 +2,150 @@
 import asyncio
 import os
 import time
-from datetime import datetime
-from datetime import timezone
+from collections import OrderedDict
+from urllib.parse import quote
 
 import discord
 
-import kayo
 from kayo import instance
+from kayo.fetch import FetchError
+from kayo.ingest import archive_batch
+from kayo.ingest import parse_schedule_page
+from kayo.ingest import RefreshBatch
+from kayo.ingest import stale_matches
+from kayo.ingest import store_batch
+from kayo.league import fetch_leagues
 from kayo.league import get_leagues
-from kayo.league import League
-from kayo.match import Match
-from kayo.match import upsert_matches
-from kayo.team import Team
+from kayo.match import ARCHIVE_BATCH_SIZE
+from kayo.match import MATCH_RETENTION_DAYS
+from kayo.schedule import get_schedule_cursors
+from kayo.schedule import ScheduleCursor
+
+
+SCHEDULE_URL = "https://esports-api.service.valorantesports.com/persisted/val/getSchedule?hl=en-US&sport=val&leagueId="
+SCHEDULE_NEWER_PAGES = int(os.getenv("SCHEDULE_NEWER_PAGES", "10"))
+SCHEDULE_BACKFILL_PAGES = int(os.getenv("SCHEDULE_BACKFILL_PAGES", "5"))
 
 
 async def fetch_events_and_teams():
-    """Downloads events and teams from the Riot API. Then inserts it in the database.
+    """Downloads leagues, events and teams from the Riot API. Then inserts it in the database.
+
+    The schedules of the leagues already known are fetched while the league list
+    itself is being refreshed, leagues discovered by that refresh are then added
+    to the same batch of tasks.
 
     Returns:
-        dict: the response of the API as a JSON
+        dict[str, ChangeSet]: The changes written, by table.
     """
-    list_of_teams = []
-    list_of_matches = []
+    batch = RefreshBatch()
+    cursors = await get_schedule_cursors()
     async with asyncio.TaskGroup() as tg:
-        for league in get_leagues():
-            tg.create_task(fetch_teams_from_league(league, list_of_teams, list_of_matches))
+        known_leagues = {league.id for league in await get_leagues()}
+        for league_id in known_leagues:
+            tg.create_task(fetch_teams_from_league(league_id, cursors.get(league_id), batch))
+        for league in await fetch_leagues():
+            if int(league.id) not in known_leagues:
+                tg.create_task(fetch_teams_from_league(int(league.id), None, batch))
 
-    kayo.team.upsert_teams(list_of_teams)
-    upsert_matches(list_of_matches)
-    instance.logger.info('Finished updating Matches and Teams !')
+    batch.stale = stale_matches(batch, instance.response_cache)
+    changes = await instance.ingest_worker.transaction(store_batch, batch)
+    # Only remember the responses once they are safely in the database
+    for key, (headers, body, pages) in batch.responses.items():
+        instance.response_cache.store(key, headers, body, meta=pages)
+    instance.logger.info(f'Finished updating Matches and Teams ! teams {changes["teams"]}, matches {changes["matches"]}, {instance.response_cache}')
+    return changes
 
 
-async def fetch_teams_from_league(league: League, list_of_teams, list_of_matches):
+async def archive_old_matches():
+    """Moves the matches older than MATCH_RETENTION_DAYS to the archive.
+
+    Every batch is its own job on the ingest worker, so the write lock is released in
+    between and a refresh is never stuck behind a large archival.
+
+    Returns:
+        int: Number of archived matches.
+    """
+    cutoff = int(time.time()) - MATCH_RETENTION_DAYS * 86400
+    archived = 0
+    while (moved := await instance.ingest_worker.transaction(archive_batch, cutoff, ARCHIVE_BATCH_SIZE)) > 0:
+        archived += moved
+        if moved < ARCHIVE_BATCH_SIZE:
+            break
+    instance.logger.info(f'Archived {archived} matches that started before {cutoff}')
+    return archived
+
+
+async def fetch_teams_from_league(league_id: int, cursor: ScheduleCursor, batch: RefreshBatch):
     """Gets teams and matches from a League.
 
+    The first page of the schedule and the pages newer than it are fetched on every call,
+    the older pages are walked a few at a time until the whole history has been ingested.
+
     Args:
-        league (League): The League object to extract into from.
-        list_of_teams (List[Team]): List of Teams to be upserted in the DB later.
-        list_of_matches (List[Matches]): List of Matches to be upserted in the DB later.
+        league_id (int): Identifier of the League to extract info from.
+        cursor (ScheduleCursor): How far the schedule has been ingested, None for a new League.
+        batch (RefreshBatch): Where the fetched rows are gathered.
     """
-    url = "https://esports-api.service.valorantesports.com/persisted/val/getSchedule?hl=en-US&sport=val&leagueId="
-    headers = {"X-Api-Key": os.getenv("RIOT_API_KEY")}
     try:
-        async with instance.http_client.get(f'{url}{league.id}', headers=headers) as response:
-            data = await response.json()
-            data = data["data"]
-            # Going through all the teams in the upcoming events
-            for i in data["schedule"]["events"]:
-                # Creating both teams and flushing them to the DB
-                team_a_dict = i["match"]["teams"][0]
-                team_a = Team(**{k: team_a_dict[k] for k in dir(League) if k in team_a_dict})
-                list_of_teams.append(team_a)
-
-                team_b_dict = i["match"]["teams"][1]
-                team_b = Team(**{k: team_b_dict[k] for k in dir(League) if k in team_b_dict})
-                list_of_teams.append(team_b)
-
-                match_dict = i["match"]
-                match = Match(
-                    id=match_dict["id"],
-                    league_id=league.id,
-                    startTime=datetime.strptime(i["startTime"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).astimezone(tz=None),
-                    bo_count=i["match"]["strategy"]["count"],
-                    blockName=i["blockName"],
-                    team_a=team_a.name,
-                    team_b=team_b.name
-                )
-                list_of_matches.append(match)
-    except KeyError as e:
-        instance.logger.error(f'Error while parsing Riot API data : {e}. Riots API responded with the following response code : {response.status} and data {await response.json()}')
+        pages = await fetch_schedule_page(league_id, None, batch)
+
+        token = pages.get("newer")
+        for _ in range(SCHEDULE_NEWER_PAGES):
+            if token is None:
+                break
+            token = (await fetch_schedule_page(league_id, token, batch)).get("newer")
+
+        if cursor is None:
+            cursor = ScheduleCursor(league_id=league_id, older=pages.get("older"))
+        if not cursor.backfilled:
+            token = cursor.older
+            for _ in range(SCHEDULE_BACKFILL_PAGES):
+                if token is None:
+                    break
+                token = (await fetch_schedule_page(league_id, token, batch)).get("older")
+            batch.cursors.append(ScheduleCursor(league_id=league_id, older=token, backfilled=token is None))
+    except FetchError as e:
+        instance.logger.error(f'Error while fetching the schedule of league {league_id} : {e}')
+    except (KeyError, ValueError):
+        # Already logged with the response by fetch_schedule_page()
+        pass
     except AttributeError as e:
         instance.logger.error(f'Problem with parsing team : {e}')
-    return data
+    except Exception as e:
+        # One league failing must not cancel the other fetches of the TaskGroup
+        instance.logger.exception(f'Unexpected error while fetching league {league_id} : {e}')
+
+
+async def fetch_schedule_page(league_id: int, token, batch):
+    """Gets teams and matches from a single page of a League's schedule.
+
+    Pages that did not change since the last refresh are not parsed again.
+
+    Args:
+        league_id (int): Identifier of the League to extract info from.
+        token (str): Token of the page, None for the first page.
+        batch (RefreshBatch): Where the fetched rows are gathered.
+
+    Returns:
+        dict: The older and newer page tokens of the page, and the ids of its matches.
+    """
+    key = str(league_id) if token is None else f'{league_id}:{token}'
+    url = f'{SCHEDULE_URL}{league_id}' if token is None else f'{SCHEDULE_URL}{league_id}&pageToken={quote(token)}'
+    headers = {"X-Api-Key": os.getenv("RIOT_API_KEY"), **instance.response_cache.headers(key)}
+    response = await instance.fetcher.get(url, headers=headers)
+    if instance.response_cache.is_unchanged(key, response.status, response.body):
+        return instance.response_cache.meta(key) or {}
+    try:
+        pages = await instance.ingest_worker.run(parse_schedule_page, league_id, response.body, batch)
+    except (KeyError, ValueError) as e:
+        instance.logger.error(f'Error while parsing Riot API data : {e}. Riots API responded with the following response code : {response.status} and data {response.body}')
+        raise
+    batch.responses[key] = (response.headers, response.body, pages)
+    return pages
 
 
 async def embed_alert(match):
-    """Creates a discord.Embed object to be sent by send_match_alert().
+    """Creates a discord.Embed object to be sent by post_alerts().
 
     Args:
         match (Match): The Match in which both Teams will face off
@@ -86,38 +154,90 @@ async def embed_alert(match):
         discord.Embed: The discord.Embed object representing the alert
     """
     embed = discord.Embed(
-        title=f'{match.team_a} ⚔️ {match.team_b}',
-        description=f'{match.league.name} · {match.blockName} · BO{match.bo_count}\nStarts at <t:{int(time.mktime(match.startTime.timetuple()))}:f>',
+        title=f'{match.team_a.name} ⚔️ {match.team_b.name}',
+        description=f'{match.league.name} · {match.blockName} · BO{match.bo_count}\nStarts at <t:{match.startTime}:f>',
         color=discord.Colour.red(),
     )
 
-    # embed.add_field(name='Start time', value=f'Starts at <t:{int(time.mktime(match.startTime.replace(tzinfo=datetime.now().astimezone().tzinfo).astimezone(tz=timezone.utc).timetuple()))}:f>')
-
-    if match.team_a in instance.referential["teams"] and instance.referential["teams"][match.team_a] != "":
-        embed.add_field(name=f'{match.team_a}\'s stream', value=f'[Link]({instance.referential["teams"][match.team_a]})', inline=True)
+    if match.team_a.name in instance.referential["teams"] and instance.referential["teams"][match.team_a.name] != "":
+        embed.add_field(name=f'{match.team_a.name}\'s stream', value=f'[Link]({instance.referential["teams"][match.team_a.name]})', inline=True)
 
     if match.league.name in instance.referential["leagues"] and instance.referential["leagues"][match.league.name] != "":
         embed.add_field(name="Official stream", value=f'[Link]({instance.referential["leagues"][match.league.name]})', inline=True)
 
-    if match.team_b in instance.referential["teams"] and instance.referential["teams"][match.team_b] != "":
-        embed.add_field(name=f'{match.team_b}\'s stream', value=f'[Link]({instance.referential["teams"][match.team_b]})', inline=True)
+    if match.team_b.name in instance.referential["teams"] and instance.referential["teams"][match.team_b.name] != "":
+        embed.add_field(name=f'{match.team_b.name}\'s stream', value=f'[Link]({instance.referential["teams"][match.team_b.name]})', inline=True)
 
     embed.set_thumbnail(url=f'{match.league.image}')
     return embed
 
 
-async def send_match_alert(channel_id, match):
-    """Sends an alert to a specified channel_id for a specific Match.
+class EmbedCache:
+    """Embeds of the matches being alerted, rendered once and shared by every recipient channel.
+
+    An embed is kept along with the version of what it shows, the Match, its League and Teams
+    and their streams in the referential, and rendered again when any of them changed.
+
+    Args:
+        size (int): Maximum number of embeds kept, the least recently used are dropped.
+    """
+
+    def __init__(self, size):
+        """Creates an empty cache."""
+        self.size = size
+        self.entries: OrderedDict[int, tuple] = OrderedDict()
+
+    @staticmethod
+    def version(match):
+        """Gets everything an embed shows about a Match.
+
+        Args:
+            match (Match): The Match, with its League and Teams loaded.
+
+        Returns:
+            tuple: The content of the embed.
+        """
+        teams, leagues = instance.referential["teams"], instance.referential["leagues"]
+        return (
+            match.team_a.name, match.team_b.name, match.league.name, match.league.image, match.blockName, match.bo_count, match.startTime,
+            teams.get(match.team_a.name), teams.get(match.team_b.name), leagues.get(match.league.name),
+        )
+
+    async def get(self, match):
+        """Gets the embed of a Match, rendering it if needed.
+
+        Args:
+            match (Match): The Match, with its League and Teams loaded.
+
+        Returns:
+            discord.Embed: The embed representing the alert.
+        """
+        version = self.version(match)
+        if (entry := self.entries.get(match.id)) is None or entry[0] != version:
+            entry = (version, await embed_alert(match))
+            self.entries[match.id] = entry
+        self.entries.move_to_end(match.id)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return entry[1]
+
+
+embed_cache = EmbedCache(256)
+
+
+async def post_alerts(channel_id, embeds):
+    """Sends alert embeds to a specified channel_id in a single message, letting errors through.
 
     Args:
         channel_id (int): Integer representing a single Discord channel.
-        match (Match): Match object for which we wish to send an Alert.
+        embeds (list[discord.Embed]): Up to 10 embeds, see embed_alert().
+
+    Raises:
+        discord.NotFound: If the channel does not exist anymore.
+        discord.Forbidden: If the bot cannot see the channel or send messages to it.
     """
-    try:
-        channel = instance.bot.get_channel(channel_id)
-        if channel is None:
-            raise BaseException(f'Couldnt get the alert channel with id : {channel_id}')
-        await channel.send(embed=await embed_alert(match))
-    except Exception as e:
-        instance.logger.exception(f'Got an exception sending an alert : {e}')
-        pass
+    channel = instance.bot.get_channel(channel_id)
+    if channel is None:
+        # Not in the cache, the channel may still exist
+        channel = await instance.bot.fetch_channel(channel_id)
+    await channel.send(embeds=embeds)
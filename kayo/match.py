@@ -1,22 +1,33 @@
 """Contains the Match dataclass and functions to interact with it."""
 import os
-from datetime import datetime
-from datetime import timedelta
 from typing import Optional
 
-from sqlalchemy import DateTime
+from sqlalchemy import Column
+from sqlalchemy import delete
 from sqlalchemy import ForeignKey
+from sqlalchemy import insert
+from sqlalchemy import Integer
 from sqlalchemy import select
 from sqlalchemy import String
-from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy import Table
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
 from sqlalchemy.orm import relationship
 
 from kayo import instance
+from kayo.db import reader
+from kayo.ledger import LedgerEntry
 from kayo.league import League
 from kayo.model import Base
+from kayo.model import max_variables
+from kayo.model import upsert
+from kayo.team import Team
+
+MATCH_RETENTION_DAYS = int(os.getenv("MATCH_RETENTION_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
 
 
 class Match(Base):
@@ -30,80 +41,112 @@ class Match(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     league_id: Mapped[Optional[int]] = mapped_column(ForeignKey("leagues.id"))
-    startTime: Mapped[DateTime] = mapped_column(DateTime(timezone=True))
-    bo_count: Mapped[int] = mapped_column(String(60))
+    # UTC epoch, in seconds
+    startTime: Mapped[int] = mapped_column(index=True)
+    bo_count: Mapped[int] = mapped_column()
     blockName: Mapped[str] = mapped_column(String(60))
-    team_a: Mapped[str] = mapped_column(ForeignKey("teams.name"))
-    team_b: Mapped[str] = mapped_column(ForeignKey("teams.name"))
+    team_a_id: Mapped[int] = mapped_column(ForeignKey("teams.id"), default=None)
+    team_b_id: Mapped[int] = mapped_column(ForeignKey("teams.id"), default=None)
+
+    league: Mapped[League] = relationship(default=None, repr=False)
+    team_a: Mapped[Team] = relationship(foreign_keys=[team_a_id], default=None, repr=False)
+    team_b: Mapped[Team] = relationship(foreign_keys=[team_b_id], default=None, repr=False)
+
 
-    league: Mapped[League] = relationship(default=None)
+# Same columns as the matches, with the names of the teams instead of foreign keys: the
+# archive is only written to, and must not prevent a League or a Team from being changed.
+matches_archive = Table(
+    "matches_archive",
+    Base.metadata,
+    Column("id", Integer, primary_key=True),
+    Column("league_id", Integer),
+    Column("startTime", Integer, nullable=False),
+    Column("bo_count", Integer, nullable=False),
+    Column("blockName", String(60), nullable=False),
+    Column("team_a", String(60), nullable=False),
+    Column("team_b", String(60), nullable=False),
+)
 
 
-def upsert_matches(matches: list[Match]):
-    """Upserts matches.
+def upsert_matches(session, matches: list[Match]):
+    """Upserts matches, the caller commits.
 
     Args:
+        session (sqlalchemy.orm.Session): Session used for the writes.
         matches (list[Match]): Matches to upsert.
     """
-    # https://www.sqlite.org/limits.html#max_variable_number
-    for i in range(0, len(matches), 100):
-        stmt = insert(Match).values(
-            [
-                {
-                    "id": match.id,
-                    "league_id": match.league_id,
-                    "startTime": match.startTime,
-                    "bo_count": match.bo_count,
-                    "blockName": match.blockName,
-                    "team_a": match.team_a,
-                    "team_b": match.team_b,
-                }
-                for match in matches[
-                    i: i + 100
-                    if i + 100 < len(matches)
-                    else len(matches)
-                ]
-            ]
-        )
-        stmt = stmt.on_conflict_do_update(
-            index_elements=["id"],
-            set_={
-                "league_id": stmt.excluded.league_id,
-                "startTime": stmt.excluded.startTime,
-                "bo_count": stmt.excluded.bo_count,
-                "blockName": stmt.excluded.blockName,
-                "team_a": stmt.excluded.team_a,
-                "team_b": stmt.excluded.team_b,
-            },
+    upsert(session, Match, matches)
+
+
+def delete_matches(session, match_ids: list[int]):
+    """Deletes matches and their entries in the delivery ledger, the caller commits.
+
+    Args:
+        session (sqlalchemy.orm.Session): Session used for the writes.
+        match_ids (list[int]): Ids of the matches to delete.
+    """
+    size = max_variables()
+    for i in range(0, len(match_ids), size):
+        session.execute(delete(LedgerEntry).where(LedgerEntry.match_id.in_(match_ids[i: i + size])))
+        session.execute(delete(Match).where(Match.id.in_(match_ids[i: i + size])))
+
+
+def archive_matches(session, cutoff: int, limit: int):
+    """Moves the oldest matches that started before a date to the archive, the caller commits.
+
+    Args:
+        session (sqlalchemy.orm.Session): Session used for the writes.
+        cutoff (int): UTC epoch before which matches are archived.
+        limit (int): Maximum number of matches moved.
+
+    Returns:
+        list[int]: Ids of the archived matches.
+    """
+    ids = list(session.scalars(select(Match.id).where(Match.startTime < cutoff).order_by(Match.startTime).limit(limit)))
+    if ids:
+        columns = [column.name for column in matches_archive.columns]
+        # A match fetched again after being archived replaces its archived copy
+        team_a, team_b = aliased(Team), aliased(Team)
+        archived = (
+            select(Match.id, Match.league_id, Match.startTime, Match.bo_count, Match.blockName, team_a.name, team_b.name)
+            .join(team_a, Match.team_a_id == team_a.id)
+            .join(team_b, Match.team_b_id == team_b.id)
+            .where(Match.id.in_(ids))
         )
-        instance.session.execute(stmt)
-    instance.session.commit()
+        session.execute(insert(matches_archive).prefix_with("OR REPLACE").from_select(columns, archived))
+        delete_matches(session, ids)
+    return ids
+
 
+async def get_matches(limit=None):
+    """Gets the matches in the database, the latest first.
 
-def get_matches():
-    """Gets all the matches in the database.
+    Args:
+        limit (int, optional): Maximum number of matches. Defaults to None, for all of them.
 
     Returns:
-       List[Match]: All the matches in the database.
+       List[Match]: The matches in the database.
     """
     try:
-        return [x[0] for x in instance.session.execute(select(Match)).all()]
+        query = select(Match).options(joinedload(Match.league), joinedload(Match.team_a), joinedload(Match.team_b)).order_by(Match.startTime.desc()).limit(limit)
+        async with reader() as session:
+            return [x[0] for x in (await session.execute(query)).all()]
     except SQLAlchemyError as e:
         instance.logger.error(f'Error while getting matches from the database: {e}')
 
 
-def get_upcoming_matches():
-    """Gets all the matches happening in the next 5 minutes in the database.
+async def get_start_times(after: int):
+    """Gets the start times of the matches starting after a date.
+
+    Args:
+        after (int): UTC epoch.
 
     Returns:
-        List[Matches]: All the matches happening in the next 5 minutes.
+        dict[int, int]: The start times, by Match id.
     """
     try:
-        if os.getenv('DEPLOYED') == 'production':
-            in_5_mins = datetime.now() + timedelta(minutes=5)
-            instance.logger.info(f'Checking for new matches in between {datetime.now()} and {in_5_mins}')
-            return [x[0] for x in instance.session.execute(select(Match).where(in_5_mins > Match.startTime, Match.startTime > datetime.now())).all()]
-        else:
-            return [x[0] for x in instance.session.execute(select(Match).where(Match.startTime > datetime.now())).all()][0:5]
+        async with reader() as session:
+            return dict((await session.execute(select(Match.id, Match.startTime).where(Match.startTime > after))).tuples().all())
     except SQLAlchemyError as e:
         instance.logger.error(f'Error while getting matches from the database: {e}')
+        return {}
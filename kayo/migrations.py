@@ -0,0 +1,174 @@
+"""Contains the schema migrations of the database, applied at startup.
+
+The version of a database is stored in SQLite's `user_version`. A new database is created
+from the models and stamped with the latest version, an existing one goes through every
+migration newer than its version. Migrations only use plain SQL, so they keep working
+whatever the models become later.
+
+Tables are rebuilt by creating the new table, copying the rows, dropping the old table and
+renaming the new one: renaming the old table first would make SQLite rewrite the foreign
+keys of the other tables to point to it.
+
+The migrations run before the missing tables are created, they only rely on the tables
+of the versions they upgrade from.
+"""
+from sqlalchemy import inspect
+
+# Every model must be mapped for the missing tables to be created
+import kayo.alert  # noqa: F401
+import kayo.ledger  # noqa: F401
+import kayo.match  # noqa: F401
+import kayo.schedule  # noqa: F401
+from kayo import instance
+from kayo.model import Base
+
+
+def _epoch_start_times(connection):
+    """Stores matches.startTime as an indexed UTC epoch and indexes the alerts lookups.
+
+    The start times used to be stored as naive DateTimes in the local time of the host,
+    which is UTC in the Docker image.
+    """
+    connection.exec_driver_sql("""
+        CREATE TABLE matches_new (
+            id INTEGER NOT NULL,
+            league_id INTEGER,
+            "startTime" INTEGER NOT NULL,
+            bo_count VARCHAR(60) NOT NULL,
+            "blockName" VARCHAR(60) NOT NULL,
+            team_a VARCHAR(60) NOT NULL,
+            team_b VARCHAR(60) NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(league_id) REFERENCES leagues (id),
+            FOREIGN KEY(team_a) REFERENCES teams (name),
+            FOREIGN KEY(team_b) REFERENCES teams (name)
+        )
+    """)
+    connection.exec_driver_sql("""
+        INSERT INTO matches_new
+        SELECT id, league_id, CAST(strftime('%s', "startTime") AS INTEGER), bo_count, "blockName", team_a, team_b
+        FROM matches
+    """)
+    connection.exec_driver_sql("DROP TABLE matches")
+    connection.exec_driver_sql("ALTER TABLE matches_new RENAME TO matches")
+    connection.exec_driver_sql('CREATE INDEX "ix_matches_startTime" ON matches ("startTime")')
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_alerts_team_name ON alerts (team_name)")
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_alerts_league_id ON alerts (league_id)")
+
+
+def _team_surrogate_keys(connection):
+    """Identifies teams by an integer instead of their name and stores bo_count as an integer.
+
+    The archive keeps the names of the teams, only its bo_count changes. It does not exist
+    on databases older than the archive, which get it created with the other missing tables.
+    """
+    tables = ["matches", "alerts", "teams"]
+    connection.exec_driver_sql("""
+        CREATE TABLE teams_new (
+            id INTEGER NOT NULL,
+            name VARCHAR(60) NOT NULL,
+            image VARCHAR(500) NOT NULL,
+            PRIMARY KEY (id),
+            UNIQUE (name)
+        )
+    """)
+    connection.exec_driver_sql("INSERT INTO teams_new (name, image) SELECT name, image FROM teams ORDER BY name")
+    connection.exec_driver_sql("""
+        CREATE TABLE matches_new (
+            id INTEGER NOT NULL,
+            league_id INTEGER,
+            "startTime" INTEGER NOT NULL,
+            bo_count INTEGER NOT NULL,
+            "blockName" VARCHAR(60) NOT NULL,
+            team_a_id INTEGER NOT NULL,
+            team_b_id INTEGER NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(league_id) REFERENCES leagues (id),
+            FOREIGN KEY(team_a_id) REFERENCES teams (id),
+            FOREIGN KEY(team_b_id) REFERENCES teams (id)
+        )
+    """)
+    connection.exec_driver_sql("""
+        INSERT INTO matches_new
+        SELECT m.id, m.league_id, m."startTime", CAST(m.bo_count AS INTEGER), m."blockName", a.id, b.id
+        FROM matches m
+        JOIN teams_new a ON a.name = m.team_a
+        JOIN teams_new b ON b.name = m.team_b
+    """)
+    connection.exec_driver_sql("""
+        CREATE TABLE alerts_new (
+            id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            league_id INTEGER,
+            team_id INTEGER,
+            PRIMARY KEY (id),
+            CONSTRAINT channel_league_alert_uc UNIQUE (channel_id, league_id),
+            CONSTRAINT channel_team_alert_uc UNIQUE (channel_id, team_id),
+            FOREIGN KEY(league_id) REFERENCES leagues (id),
+            FOREIGN KEY(team_id) REFERENCES teams (id)
+        )
+    """)
+    connection.exec_driver_sql("""
+        INSERT INTO alerts_new
+        SELECT alerts.id, alerts.channel_id, alerts.league_id, teams_new.id
+        FROM alerts
+        LEFT JOIN teams_new ON teams_new.name = alerts.team_name
+    """)
+    if connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'matches_archive'").first() is not None:
+        tables.append("matches_archive")
+        _rebuild_archive(connection)
+    for table in tables:
+        connection.exec_driver_sql(f"DROP TABLE {table}")
+        connection.exec_driver_sql(f"ALTER TABLE {table}_new RENAME TO {table}")
+    connection.exec_driver_sql('CREATE INDEX "ix_matches_startTime" ON matches ("startTime")')
+    connection.exec_driver_sql("CREATE INDEX ix_alerts_team_id ON alerts (team_id)")
+    connection.exec_driver_sql("CREATE INDEX ix_alerts_league_id ON alerts (league_id)")
+
+
+def _rebuild_archive(connection):
+    """Copies the archive to a new table storing bo_count as an integer."""
+    connection.exec_driver_sql("""
+        CREATE TABLE matches_archive_new (
+            id INTEGER NOT NULL,
+            league_id INTEGER,
+            "startTime" INTEGER NOT NULL,
+            bo_count INTEGER NOT NULL,
+            "blockName" VARCHAR(60) NOT NULL,
+            team_a VARCHAR(60) NOT NULL,
+            team_b VARCHAR(60) NOT NULL,
+            PRIMARY KEY (id)
+        )
+    """)
+    connection.exec_driver_sql("""
+        INSERT INTO matches_archive_new
+        SELECT id, league_id, "startTime", CAST(bo_count AS INTEGER), "blockName", team_a, team_b
+        FROM matches_archive
+    """)
+
+
+# Append new migrations at the end, never edit or reorder the ones already released
+MIGRATIONS = [
+    _epoch_start_times,
+    _team_surrogate_keys,
+]
+
+
+def migrate(engine):
+    """Creates the missing tables and brings the schema of the database to the latest version.
+
+    Args:
+        engine (sqlalchemy.Engine): Engine of the database to migrate.
+    """
+    with engine.connect() as connection:
+        # The sqlite3 module does not open transactions for DDL statements by itself
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+        if version == 0 and not inspect(connection).has_table("matches"):
+            version = len(MIGRATIONS)
+        for number, migration in enumerate(MIGRATIONS, start=1):
+            if number > version:
+                instance.logger.info(f'Migrating the database to version {number}: {migration.__doc__.splitlines()[0]}')
+                migration(connection)
+        Base.metadata.create_all(connection)
+        connection.exec_driver_sql(f"PRAGMA user_version = {len(MIGRATIONS)}")
+        connection.commit()
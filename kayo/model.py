@@ -1,7 +1,19 @@
-"""_summary_."""
+"""Contains the ORM Base class and the bulk upsert shared by all the tables."""
+import os
+import sqlite3
+import time
+
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import MappedAsDataclass
 
+from kayo import instance
+
+UPSERT_EXECUTEMANY_THRESHOLD = int(os.getenv("UPSERT_EXECUTEMANY_THRESHOLD", "1000"))
+
+# Read once from the synchronous engine, see https://www.sqlite.org/limits.html#max_variable_number
+_max_variables = None
+
 
 class Base(MappedAsDataclass, DeclarativeBase):
     """Base SQLalchemy Class.
@@ -11,3 +23,63 @@ class Base(MappedAsDataclass, DeclarativeBase):
     """
 
     pass
+
+
+def max_variables():
+    """Gets the maximum number of host parameters in a single SQLite statement.
+
+    The aiosqlite connections cannot be asked for it, they use the same SQLite library
+    as the synchronous engine.
+
+    Returns:
+        int: The limit of the SQLite library in use.
+    """
+    global _max_variables
+    if _max_variables is None:
+        try:
+            with instance.engine.connect() as connection:
+                _max_variables = connection.connection.dbapi_connection.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+        except AttributeError:
+            # Connection.getlimit() only exists since Python 3.11
+            _max_variables = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+    return _max_variables
+
+
+def upsert(session, model, objects, keys=None):
+    """Inserts objects, or updates every column but the key of the rows already there.
+
+    Nothing is committed, so several upserts can share a single transaction. Small
+    batches are sent as multi-row INSERTs sized from the SQLite parameter limit, large
+    ones as a single statement executed for every row (executemany).
+
+    Args:
+        session (sqlalchemy.orm.Session): Session used for the writes.
+        model (kayo.model.Base): Mapped class of the table.
+        objects (list): Objects, or dicts, to upsert.
+        keys (list[str], optional): Unique columns identifying a row. Defaults to None, for
+        the primary key. A primary key left out of the keys is generated by the database.
+    """
+    if not objects:
+        return
+    start = time.perf_counter()
+    table = model.__table__
+    if keys is None:
+        keys = [column.name for column in table.primary_key.columns]
+    columns = [column.name for column in table.columns if not column.primary_key or column.name in keys]
+    rows = [obj if isinstance(obj, dict) else {column: getattr(obj, column) for column in columns} for obj in objects]
+
+    stmt = insert(table)
+    updates = {column: stmt.excluded[column] for column in columns if column not in keys}
+
+    def on_conflict(stmt):
+        if updates:
+            return stmt.on_conflict_do_update(index_elements=keys, set_=updates)
+        return stmt.on_conflict_do_nothing(index_elements=keys)
+
+    if len(rows) >= UPSERT_EXECUTEMANY_THRESHOLD:
+        session.execute(on_conflict(stmt), rows)
+    else:
+        size = max(1, max_variables() // len(columns))
+        for i in range(0, len(rows), size):
+            session.execute(on_conflict(stmt.values(rows[i: i + size])))
+    instance.logger.debug(f'Upserted {len(rows)} rows into {table.name} in {time.perf_counter() - start:.3f}s')
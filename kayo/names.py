@@ -0,0 +1,110 @@
+"""Contains the in-memory index used to autocomplete the names of Leagues and Teams."""
+from bisect import bisect_left
+
+# Discord shows at most 25 choices
+MAX_CHOICES = 25
+
+
+def is_subsequence(text, folded):
+    """Checks if the characters of a text appear in order in a name.
+
+    Args:
+        text (str): Folded text typed by the user.
+        folded (str): Folded name.
+
+    Returns:
+        bool: True if the name contains every character of the text, in order.
+    """
+    characters = iter(folded)
+    return all(character in characters for character in text)
+
+
+class NameIndex:
+    """Sorted, case-insensitive copy of the names of a table.
+
+    The index is rebuilt by the ingest worker while autocompletion reads it from the
+    event loop: a rebuild builds new entries and swaps them in a single assignment, so
+    a search always sees either the old or the new names.
+    """
+
+    def __init__(self):
+        """Creates an empty index, loaded from the database on first use."""
+        self.entries: tuple[tuple[str, str], ...] = ()
+        self.names: frozenset[str] = frozenset()
+        self.loaded = False
+
+    def __len__(self) -> int:
+        """Counts the names.
+
+        Returns:
+            int: Number of names in the index.
+        """
+        return len(self.entries)
+
+    def rebuild(self, names):
+        """Replaces the content of the index.
+
+        Args:
+            names (Iterable[str]): Every name of the table.
+        """
+        names = frozenset(names)
+        self.entries, self.names = tuple(sorted((name.casefold(), name) for name in names)), names
+        self.loaded = True
+
+    def covers(self, names):
+        """Checks if names are all in the index already.
+
+        Args:
+            names (Iterable[str]): Names that have just been stored.
+
+        Returns:
+            bool: True if the index does not need to be rebuilt.
+        """
+        return self.loaded and self.names.issuperset(names)
+
+    def all(self):
+        """Gets every name of the index.
+
+        Returns:
+            list[str]: The names, sorted case-insensitively.
+        """
+        return [name for _, name in self.entries]
+
+    def search(self, text, limit=MAX_CHOICES):
+        """Finds the names best matching what the user typed.
+
+        Names starting with the text come first, then names with a word starting with it,
+        then names containing it, then names containing its characters in order. Shorter
+        names come first within each group.
+
+        Args:
+            text (str): What the user typed so far.
+            limit (int, optional): Maximum number of names returned. Defaults to MAX_CHOICES.
+
+        Returns:
+            list[str]: The best matching names.
+        """
+        entries = self.entries
+        text = (text or "").strip().casefold()
+        if not text:
+            return [name for _, name in entries[:limit]]
+
+        # Prefix matches are contiguous in the sorted entries
+        start = end = bisect_left(entries, (text,))
+        while end < len(entries) and entries[end][0].startswith(text):
+            end += 1
+        ranked = [(0, len(folded), folded, name) for folded, name in entries[start:end]]
+        if len(ranked) < limit:
+            for folded, name in entries[:start] + entries[end:]:
+                if any(word.startswith(text) for word in folded.split()):
+                    ranked.append((1, len(folded), folded, name))
+                elif text in folded:
+                    ranked.append((2, len(folded), folded, name))
+                elif is_subsequence(text, folded):
+                    ranked.append((3, len(folded), folded, name))
+        ranked.sort()
+        return [name for *_, name in ranked[:limit]]
+
+
+league_names = NameIndex()
+team_names = NameIndex()
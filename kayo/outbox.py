@@ -0,0 +1,188 @@
+"""Contains the queue pacing the messages sent to Discord."""
+import asyncio
+import os
+import random
+import time
+
+import aiohttp
+import discord
+
+from kayo import instance
+from kayo.ratelimit import TokenBucket
+
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "8"))
+SEND_RATE = float(os.getenv("SEND_RATE", "40"))
+SEND_CHANNEL_RATE = float(os.getenv("SEND_CHANNEL_RATE", "1"))
+SEND_CHANNEL_BURST = int(os.getenv("SEND_CHANNEL_BURST", "5"))
+SEND_RETRIES = int(os.getenv("SEND_RETRIES", "3"))
+SEND_BACKOFF = float(os.getenv("SEND_BACKOFF", "1"))
+
+# Buckets of idle channels are dropped past this number, a full bucket holds no state
+_MAX_CHANNEL_BUCKETS = 10000
+
+
+class DeliveryQueue:
+    """Sends messages from a bounded pool of workers, paced by a global and a per-channel token bucket.
+
+    A large fan-out is queued at once and drained at the highest rate Discord accepts,
+    instead of starting every send at the same time. 429 and 5xx answers, network errors
+    and timeouts are retried with a backoff, honoring Retry-After.
+
+    Args:
+        send (Callable): Coroutine function sending a message, called with a channel id and the payload.
+        workers (int): Number of messages sent at the same time.
+        rate (float): Maximum number of messages sent per second, across all channels.
+        channel_rate (float): Maximum number of messages sent per second to a single channel.
+        channel_burst (int): Number of messages a channel can receive at once before being paced.
+        retries (int): Number of retries after the first attempt.
+        backoff (float): Base delay of the exponential backoff, in seconds.
+    """
+
+    def __init__(self, send, workers=SEND_WORKERS, rate=SEND_RATE, channel_rate=SEND_CHANNEL_RATE, channel_burst=SEND_CHANNEL_BURST, retries=SEND_RETRIES, backoff=SEND_BACKOFF):
+        """Creates the queue, its workers are started on the first message."""
+        self.send = send
+        self.workers = workers
+        self.bucket = TokenBucket(rate, capacity=max(1, workers))
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.channel_buckets: dict[int, TokenBucket] = {}
+        self.retries = retries
+        self.backoff = backoff
+        self.queue = None
+        self.tasks = []
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        # Consecutive dispatches Discord refused because the channel is gone or out of reach
+        self.unreachable: dict[int, int] = {}
+
+    def __repr__(self) -> str:
+        """Formats the metrics of the queue.
+
+        Returns:
+            str: Description of self.
+        """
+        done = self.sent + self.failed
+        average = self.latency_total / done if done else 0.0
+        depth = self.queue.qsize() if self.queue is not None else 0
+        return f"DeliveryQueue(depth={depth}, sent={self.sent}, failed={self.failed}, retried={self.retried}, latency_avg={average:.3f}s, latency_max={self.latency_max:.3f}s)"
+
+    def channel_bucket(self, channel_id):
+        """Gets the token bucket of a channel.
+
+        Args:
+            channel_id (int): Identifier of the channel.
+
+        Returns:
+            TokenBucket: The bucket, created full on first use.
+        """
+        if (bucket := self.channel_buckets.get(channel_id)) is None:
+            if len(self.channel_buckets) >= _MAX_CHANNEL_BUCKETS:
+                refilled = time.monotonic() - self.channel_burst / self.channel_rate if self.channel_rate > 0 else float("inf")
+                self.channel_buckets = {k: b for k, b in self.channel_buckets.items() if b.updated > refilled or b.lock.locked()}
+            bucket = self.channel_buckets[channel_id] = TokenBucket(self.channel_rate, capacity=self.channel_burst)
+        return bucket
+
+    def dead_channels(self, threshold):
+        """Gets the channels that refused too many dispatches in a row and forgets them.
+
+        Args:
+            threshold (int): Number of consecutive refused dispatches.
+
+        Returns:
+            list[int]: Identifiers of the channels.
+        """
+        dead = [channel_id for channel_id, count in self.unreachable.items() if count >= threshold]
+        for channel_id in dead:
+            del self.unreachable[channel_id]
+        return dead
+
+    async def submit(self, messages):
+        """Queues messages and waits until they are all sent or have failed.
+
+        A channel refusing one or more messages of the call counts as one refusal.
+
+        Args:
+            messages (list[tuple[int, Any]]): Channel ids and payloads of the messages.
+
+        Returns:
+            list[bool]: True for every message that has been sent, in order.
+        """
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+            self.tasks = [asyncio.create_task(self._work(), name=f"kayo-send-{i}") for i in range(self.workers)]
+        loop = asyncio.get_running_loop()
+        futures = []
+        refused = set()
+        for channel_id, payload in messages:
+            future = loop.create_future()
+            self.queue.put_nowait((channel_id, payload, future, time.monotonic(), refused))
+            futures.append(future)
+        instance.logger.info(f'Queued {len(futures)} messages, {self}')
+        results = await asyncio.gather(*futures)
+        refused -= {channel_id for (channel_id, _), sent in zip(messages, results) if sent}
+        for channel_id in refused:
+            self.unreachable[channel_id] = self.unreachable.get(channel_id, 0) + 1
+        return results
+
+    async def close(self):
+        """Stops the workers, the messages still queued are dropped."""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.queue, self.tasks = None, []
+
+    async def _work(self):
+        while True:
+            channel_id, payload, future, queued, refused = await self.queue.get()
+            try:
+                sent = await self._deliver(channel_id, payload, refused)
+            except Exception as e:
+                instance.logger.exception(f'Unexpected error while sending a message to channel {channel_id} : {e}')
+                sent = False
+            latency = time.monotonic() - queued
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            if sent:
+                self.sent += 1
+            else:
+                self.failed += 1
+            if not future.done():
+                future.set_result(sent)
+            self.queue.task_done()
+
+    async def _deliver(self, channel_id, payload, refused):
+        error = None
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            await self.channel_bucket(channel_id).acquire()
+            await self.bucket.acquire()
+            try:
+                await self.send(channel_id, payload)
+                self.unreachable.pop(channel_id, None)
+                return True
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    # Missing permissions, deleted channel... retrying will not help
+                    instance.logger.error(f'Discord rejected a message to channel {channel_id} : {e}')
+                    if e.status in (403, 404):
+                        refused.add(channel_id)
+                    return False
+                error = repr(e)
+                retry_after = e.response.headers.get("Retry-After") if e.response is not None else None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+            except Exception as e:
+                instance.logger.error(f'Could not send a message to channel {channel_id} : {e}')
+                return False
+            if attempt < self.retries:
+                self.retried += 1
+                try:
+                    delay = float(retry_after)
+                except (TypeError, ValueError):
+                    delay = random.uniform(0, self.backoff * 2 ** attempt)
+                await asyncio.sleep(delay)
+        instance.logger.error(f'Sending a message to channel {channel_id} failed after {self.retries + 1} attempts: {error}')
+        return False
@@ -0,0 +1,36 @@
+"""Contains the token bucket used to rate limit outgoing requests."""
+import asyncio
+import time
+
+
+class TokenBucket:
+    """A token bucket, refilled continuously at a fixed rate.
+
+    Args:
+        rate (float): Tokens added per second. A rate of 0 disables the limit.
+        capacity (float): Maximum number of tokens, i.e. the size of a burst.
+    """
+
+    def __init__(self, rate, capacity):
+        """Creates a full bucket."""
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Waits until a token is available and takes it."""
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
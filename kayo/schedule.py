@@ -0,0 +1,56 @@
+"""Contains the dataclass used to remember how far the schedule of each League has been ingested."""
+from typing import Optional
+
+from sqlalchemy import ForeignKey
+from sqlalchemy import select
+from sqlalchemy import String
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Mapped
+from sqlalchemy.orm import mapped_column
+
+from kayo import instance
+from kayo.db import reader
+from kayo.model import Base
+from kayo.model import upsert
+
+
+class ScheduleCursor(Base):
+    """Progress of the ingestion of a League's schedule.
+
+    The first page of a schedule holds the current and upcoming events, it is fetched
+    on every refresh along with the pages newer than it. Older pages never change, they
+    are only walked once, a few pages per refresh, and `older` remembers where to resume.
+
+    Args:
+        kayo.model.Base: Base class.
+    """
+
+    __tablename__ = "schedule_cursors"
+
+    league_id: Mapped[int] = mapped_column(ForeignKey("leagues.id"), primary_key=True)
+    older: Mapped[Optional[str]] = mapped_column(String(500), default=None)
+    backfilled: Mapped[bool] = mapped_column(default=False)
+
+
+async def get_schedule_cursors():
+    """Gets the cursors of every League.
+
+    Returns:
+        dict[int, ScheduleCursor]: The cursors, by League id.
+    """
+    try:
+        async with reader() as session:
+            return {x[0].league_id: x[0] for x in (await session.execute(select(ScheduleCursor))).all()}
+    except SQLAlchemyError as e:
+        instance.logger.error(f'Error while getting schedule cursors from the database: {e}')
+        return {}
+
+
+def upsert_schedule_cursors(session, cursors: list[ScheduleCursor]):
+    """Upserts schedule cursors, the caller commits.
+
+    Args:
+        session (sqlalchemy.orm.Session): Session used for the writes.
+        cursors (list[ScheduleCursor]): Cursors to upsert.
+    """
+    upsert(session, ScheduleCursor, cursors)
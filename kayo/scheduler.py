@@ -0,0 +1,146 @@
+"""Contains the scheduler sending the alerts of each Match at a fixed time before it starts."""
+import asyncio
+import heapq
+import os
+import time
+
+from kayo import instance
+from kayo.db import session_scope
+from kayo.dispatch import deliver
+from kayo.dispatch import get_deliveries
+from kayo.match import get_start_times
+
+ALERT_LEAD_TIME = int(os.getenv("ALERT_LEAD_TIME", "300"))
+ALERT_RETRY_DELAY = int(os.getenv("ALERT_RETRY_DELAY", "30"))
+
+
+class AlertScheduler:
+    """A min-heap of the upcoming matches, by the time their alerts are due.
+
+    Entries are never removed from the middle of the heap: a Match that is rescheduled or
+    deleted only has its start time changed or removed in `start_times`, the entries that
+    no longer match it are skipped when they reach the top.
+
+    Args:
+        lead_time (int): Seconds between an alert and the start of its Match.
+    """
+
+    def __init__(self, lead_time):
+        """Creates an empty scheduler, loaded from the database when started."""
+        self.lead_time = lead_time
+        self.heap = []
+        self.start_times: dict[int, int] = {}
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def __len__(self) -> int:
+        """Counts the scheduled matches.
+
+        Returns:
+            int: Number of matches waiting for their alerts.
+        """
+        return len(self.start_times)
+
+    def schedule(self, match_id, start_time, due=None):
+        """Schedules the alerts of a Match, replacing the ones already scheduled.
+
+        Args:
+            match_id (int): Identifier of the Match.
+            start_time (int): UTC epoch of the start of the Match.
+            due (int, optional): When the alerts are sent. Defaults to None, for the lead time before the start.
+        """
+        if due is None and self.start_times.get(match_id) == start_time:
+            return
+        self.start_times[match_id] = start_time
+        heapq.heappush(self.heap, (start_time - self.lead_time if due is None else due, match_id, start_time))
+        self.wakeup.set()
+
+    def cancel(self, match_id):
+        """Cancels the alerts of a Match.
+
+        Args:
+            match_id (int): Identifier of the Match.
+        """
+        self.start_times.pop(match_id, None)
+
+    def update(self, changes):
+        """Follows the matches written by a refresh of the database.
+
+        Args:
+            changes (ChangeSet): The changes of the matches.
+        """
+        now = int(time.time())
+        for match in changes.upserts:
+            if match.startTime > now:
+                self.schedule(match.id, match.startTime)
+            else:
+                self.cancel(match.id)
+        for match_id in changes.deleted:
+            self.cancel(match_id)
+
+    def pop_due(self, now):
+        """Removes the matches whose alerts are due from the heap.
+
+        Args:
+            now (float): Current UTC epoch.
+
+        Returns:
+            list[tuple[int, int]]: Identifiers and start times of the matches to alert.
+        """
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            _, match_id, start_time = heapq.heappop(self.heap)
+            if self.start_times.get(match_id) == start_time:
+                del self.start_times[match_id]
+                due.append((match_id, start_time))
+        return due
+
+    async def fire(self, due):
+        """Sends the alerts of matches, retrying the failed ones until the matches start.
+
+        Args:
+            due (list[tuple[int, int]]): Identifiers and start times of the matches.
+        """
+        async with session_scope():
+            failed = await deliver(await get_deliveries([match_id for match_id, _ in due], due_only=True))
+        self.retry({(d.match.id, d.match.startTime) for d in failed})
+
+    def retry(self, due):
+        """Schedules the alerts of matches again after ALERT_RETRY_DELAY, unless the matches start before.
+
+        Args:
+            due (Iterable[tuple[int, int]]): Identifiers and start times of the matches.
+        """
+        now = int(time.time())
+        for match_id, start_time in due:
+            if start_time > now + ALERT_RETRY_DELAY and match_id not in self.start_times:
+                self.schedule(match_id, start_time, due=now + ALERT_RETRY_DELAY)
+
+    async def run(self):
+        """Sleeps until the next alerts are due and sends them, forever."""
+        for match_id, start_time in (await get_start_times(int(time.time()))).items():
+            self.schedule(match_id, start_time)
+        instance.logger.info(f'Scheduled the alerts of {len(self)} matches')
+        while True:
+            self.wakeup.clear()
+            if due := self.pop_due(time.time()):
+                try:
+                    await self.fire(due)
+                except Exception as e:
+                    instance.logger.exception(f'Got an exception while sending alerts : {e}')
+                    # The ledger skips the alerts that went out before the exception
+                    self.retry(due)
+                continue
+            timeout = self.heap[0][0] - time.time() if self.heap else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except TimeoutError:
+                pass
+
+    def start(self):
+        """Starts the scheduler, unless it is already running."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run(), name="kayo-alerts")
+
+
+scheduler = AlertScheduler(ALERT_LEAD_TIME)
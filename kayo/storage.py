@@ -0,0 +1,136 @@
+"""Contains the SQLite storage profile and the engines built from it."""
+import atexit
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+
+from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+@dataclass
+class StorageProfile:
+    """PRAGMAs applied to every SQLite connection.
+
+    Args:
+        journal_mode (str): Journal mode of the database, WAL lets readers and the writer work at the same time.
+        synchronous (str): When SQLite waits for the disk, NORMAL is safe with WAL.
+        mmap_size (int): Bytes of the database file mapped in memory.
+        cache_size (int): Page cache of each connection, in KiB when negative.
+        busy_timeout (int): Milliseconds a connection waits for a lock before failing.
+    """
+
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    mmap_size: int = 268435456
+    cache_size: int = -65536
+    busy_timeout: int = 5000
+
+    @classmethod
+    def from_env(cls):
+        """Reads the profile from the SQLITE_* environment variables.
+
+        Returns:
+            StorageProfile: The profile, with defaults for the variables not set.
+        """
+        return cls(
+            journal_mode=os.getenv("SQLITE_JOURNAL_MODE", cls.journal_mode),
+            synchronous=os.getenv("SQLITE_SYNCHRONOUS", cls.synchronous),
+            mmap_size=int(os.getenv("SQLITE_MMAP_SIZE", cls.mmap_size)),
+            cache_size=int(os.getenv("SQLITE_CACHE_SIZE", cls.cache_size)),
+            busy_timeout=int(os.getenv("SQLITE_BUSY_TIMEOUT", cls.busy_timeout)),
+        )
+
+    def apply(self, dbapi_connection, writer=True):
+        """Sets the PRAGMAs of a new connection.
+
+        Args:
+            dbapi_connection (sqlite3.Connection): The connection.
+            writer (bool, optional): False to make the connection read-only. Defaults to True.
+        """
+        cursor = dbapi_connection.cursor()
+        if writer:
+            # Persisted in the database file, the readers pick it up from there
+            cursor.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={self.synchronous}")
+        cursor.execute(f"PRAGMA mmap_size={self.mmap_size}")
+        cursor.execute(f"PRAGMA cache_size={self.cache_size}")
+        cursor.execute(f"PRAGMA busy_timeout={self.busy_timeout}")
+        if not writer:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+def create_engines(profile: StorageProfile, path=None, echo=False):
+    """Creates the engines of the database.
+
+    The event loop reads and writes through aiosqlite, the ingest thread and the
+    migrations write through a synchronous engine on the same database.
+
+    Args:
+        profile (StorageProfile): PRAGMAs of the connections.
+        path (str, optional): Path of the database file, None for a temporary database deleted at exit. Defaults to None.
+        echo (bool, optional): Logs every statement. Defaults to False.
+
+    Returns:
+        tuple[sqlalchemy.Engine, AsyncEngine, AsyncEngine]: The synchronous writer, the async writer and the async reader engines.
+    """
+    if path is None:
+        # A file rather than a shared in-memory database, which ignores busy_timeout and has no WAL
+        directory = tempfile.mkdtemp(prefix="kayo-")
+        atexit.register(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, "kayo.db")
+
+    engine = create_engine(f"sqlite:///{path}", echo=echo)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", echo=echo, poolclass=AsyncAdaptedQueuePool)
+    async_read_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", echo=echo, poolclass=AsyncAdaptedQueuePool)
+    for writer in (engine, async_engine.sync_engine):
+        event.listen(writer, "connect", lambda dbapi_connection, record: profile.apply(dbapi_connection))
+    event.listen(async_read_engine.sync_engine, "connect", lambda dbapi_connection, record: profile.apply(dbapi_connection, writer=False))
+    return engine, async_engine, async_read_engine
+
+
+class RefreshingSession(Session):
+    """A Session whose queries refresh the objects already loaded.
+
+    Rows written by the other connections are never hidden by the identity map.
+    """
+
+    pass
+
+
+@event.listens_for(RefreshingSession, "do_orm_execute")
+def _populate_existing(orm_execute_state):
+    if orm_execute_state.is_select:
+        orm_execute_state.update_execution_options(populate_existing=True)
+
+
+def read_sessionmaker(engine):
+    """Creates a session factory for the reader engine.
+
+    Args:
+        engine (AsyncEngine): The reader engine.
+
+    Returns:
+        async_sessionmaker: The session factory.
+    """
+    return async_sessionmaker(engine, expire_on_commit=False, sync_session_class=RefreshingSession)
+
+
+def write_sessionmaker(engine):
+    """Creates a session factory for the writer engine.
+
+    Objects stay usable once committed, the session is usually closed by then.
+
+    Args:
+        engine (AsyncEngine): The writer engine.
+
+    Returns:
+        async_sessionmaker: The session factory.
+    """
+    return async_sessionmaker(engine, expire_on_commit=False)
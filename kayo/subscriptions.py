@@ -0,0 +1,89 @@
+"""Contains the in-memory index of the channels following each League and Team."""
+
+
+class SubscriptionIndex:
+    """Channels subscribed to each League and Team, mirroring the alerts table.
+
+    It is loaded once from the database, then kept up to date by the functions
+    writing alerts, so finding the channels of a Match never reads the database.
+    """
+
+    def __init__(self):
+        """Creates an empty index."""
+        self.leagues: dict[int, set[int]] = {}
+        self.teams: dict[int, set[int]] = {}
+        self.loaded = False
+
+    def __len__(self) -> int:
+        """Counts the subscriptions.
+
+        Returns:
+            int: Number of alerts in the index.
+        """
+        return sum(map(len, self.leagues.values())) + sum(map(len, self.teams.values()))
+
+    def load(self, alerts):
+        """Replaces the content of the index.
+
+        Args:
+            alerts (Iterable[Alert]): Every alert of the database.
+        """
+        self.leagues, self.teams = {}, {}
+        for alert in alerts:
+            self.add(alert.channel_id, league_id=alert.league_id, team_id=alert.team_id)
+        self.loaded = True
+
+    def add(self, channel_id, league_id=None, team_id=None):
+        """Subscribes a channel to a League or a Team.
+
+        Args:
+            channel_id (int): Identifier of the channel.
+            league_id (int, optional): Identifier of the League. Defaults to None.
+            team_id (int, optional): Identifier of the Team. Defaults to None.
+        """
+        if league_id is not None:
+            self.leagues.setdefault(league_id, set()).add(channel_id)
+        if team_id is not None:
+            self.teams.setdefault(team_id, set()).add(channel_id)
+
+    def discard(self, channel_id, league_id=None, team_id=None):
+        """Unsubscribes a channel from a League or a Team.
+
+        Args:
+            channel_id (int): Identifier of the channel.
+            league_id (int, optional): Identifier of the League. Defaults to None.
+            team_id (int, optional): Identifier of the Team. Defaults to None.
+        """
+        for index, key in ((self.leagues, league_id), (self.teams, team_id)):
+            if key is not None and (channels := index.get(key)) is not None:
+                channels.discard(channel_id)
+                if not channels:
+                    del index[key]
+
+    def discard_channels(self, channel_ids):
+        """Unsubscribes channels from everything.
+
+        Args:
+            channel_ids (Iterable[int]): Identifiers of the channels.
+        """
+        channel_ids = set(channel_ids)
+        for index in (self.leagues, self.teams):
+            for key in list(index):
+                index[key] -= channel_ids
+                if not index[key]:
+                    del index[key]
+
+    def channels(self, match):
+        """Gets the channels to alert for a Match.
+
+        Args:
+            match (Match): The Match.
+
+        Returns:
+            set[int]: Channels following its League or one of its Teams.
+        """
+        empty = frozenset()
+        return self.leagues.get(match.league_id, empty) | self.teams.get(match.team_a_id, empty) | self.teams.get(match.team_b_id, empty)
+
+
+subscriptions = SubscriptionIndex()
@@ -2,7 +2,6 @@
 import discord
 from sqlalchemy import select
 from sqlalchemy import String
-from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
@@ -10,7 +9,12 @@ from sqlalchemy.orm import relationship
 
 import kayo
 from kayo import instance
+from kayo.db import reader
+from kayo.identity import team_cache
 from kayo.model import Base
+from kayo.model import max_variables
+from kayo.model import upsert
+from kayo.names import team_names
 
 
 class Team(Base):
@@ -22,45 +26,43 @@ class Team(Base):
 
     __tablename__ = "teams"
 
-    name: Mapped[str] = mapped_column(String(60), primary_key=True)
+    # The Riot API does not identify teams, a renamed team is a new one
+    id: Mapped[int] = mapped_column(primary_key=True, init=False)
+    name: Mapped[str] = mapped_column(String(60), unique=True)
     image: Mapped[str] = mapped_column(String(500))
     alerts: Mapped[list["kayo.alert.Alert"]] = relationship(
-        default_factory=list, back_populates="teams"
+        default_factory=list, back_populates="teams", repr=False
     )
 
 
-def upsert_teams(
-    teams: list[Team]
-):
-    """Upserts team objects.
+def upsert_teams(session, teams: list[Team]):
+    """Upserts team objects by name, the caller commits.
 
     Args:
+        session (sqlalchemy.orm.Session): Session used for the writes.
         teams (list[Team]): Teams to upsert
     """
-    # https://www.sqlite.org/limits.html#max_variable_number
-    for i in range(0, len(teams), 100):
-        stmt = insert(Team).values(
-            [
-                {
-                    "name": team.name,
-                    "image": team.image
-                }
-                for team in teams[
-                    i: i + 100
-                    if i + 100 < len(teams)
-                    else len(teams)
-                ]
-            ]
-        )
-        stmt = stmt.on_conflict_do_update(
-            index_elements=["name"],
-            set_={"image": stmt.excluded.image},
-        )
-        instance.session.execute(stmt)
-    instance.session.commit()
-
-
-def get_teams(ctx: discord.AutocompleteContext = None):
+    upsert(session, Team, teams, keys=["name"])
+
+
+def get_team_ids(session, names):
+    """Gets the identifiers of teams from their names.
+
+    Args:
+        session (sqlalchemy.orm.Session): Session used for the reads.
+        names (list[str]): Names of the teams.
+
+    Returns:
+        dict[str, int]: Identifiers of the teams found, by name.
+    """
+    size = max_variables()
+    ids = {}
+    for i in range(0, len(names), size):
+        ids.update(session.execute(select(Team.name, Team.id).where(Team.name.in_(names[i: i + size]))).tuples().all())
+    return ids
+
+
+async def get_teams(ctx: discord.AutocompleteContext = None):
     """Get all the teams currently in the database.
 
     Args:
@@ -70,22 +72,34 @@ def get_teams(ctx: discord.AutocompleteContext = None):
     Returns:
         List[Team]: All the Teams in the database.
     """
-    return [x[0] for x in instance.session.execute(select(Team)).all()]
+    async with reader() as session:
+        return [x[0] for x in (await session.execute(select(Team))).all()]
 
 
-def get_team_names(ctx: discord.AutocompleteContext = None):
-    """Gets a list of all the team names currently in the database.
+async def get_team_names(ctx: discord.AutocompleteContext = None):
+    """Gets the team names from the in-memory index.
 
     Args:
         ctx (discord.AutocompleteContext, optional): Used when called from autocompletion. Defaults to None.
 
     Returns:
-        List[str]: List of Team names.
+        List[str]: The best matching Team names when autocompleting, all of them otherwise.
     """
-    return [team.name for team in get_teams()]
+    await load_team_names()
+    if ctx is None:
+        return team_names.all()
+    return team_names.search(ctx.value)
+
+
+async def load_team_names():
+    """Loads the index of the team names, once."""
+    if team_names.loaded:
+        return
+    async with reader() as session:
+        team_names.rebuild((await session.execute(select(Team.name))).scalars())
 
 
-def get_team_by_name(team_name):
+async def get_team_by_name(team_name):
     """Returns a team object based on its name.
 
     Args:
@@ -95,6 +109,10 @@ def get_team_by_name(team_name):
         Team: A single team object.
     """
     try:
-        return instance.session.execute(select(Team).where(Team.name == team_name)).one()[0]
+        if (team := team_cache.get("name", team_name)) is None:
+            async with reader() as session:
+                team = (await session.execute(select(Team).where(Team.name == team_name))).one()[0]
+            team_cache.update([team])
+        return team
     except SQLAlchemyError as e:
         instance.logger.error(f'Error while getting a league from the database: {e}')
@@ -0,0 +1,85 @@
+"""Contains the worker thread running the blocking stages of the database refresh."""
+import asyncio
+import queue
+import threading
+
+from sqlalchemy.orm import Session
+
+
+def _resolve(future, result, error):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class IngestWorker:
+    """A dedicated thread parsing Riot API payloads and writing them.
+
+    Jobs are sent to the thread through a queue and run one at a time, in order, so the
+    objects they share (a RefreshBatch for example) never need a lock. Their results are
+    handed back to the event loop that submitted them.
+
+    Args:
+        engine (sqlalchemy.Engine): Engine the worker opens its sessions from.
+    """
+
+    def __init__(self, engine):
+        """Creates the worker, its thread is started on the first job."""
+        self.engine = engine
+        self.jobs = queue.SimpleQueue()
+        self.thread = None
+
+    def _run(self):
+        while (job := self.jobs.get()) is not None:
+            loop, future, function, args = job
+            result, error = None, None
+            try:
+                result = function(*args)
+            except Exception as e:
+                error = e
+            loop.call_soon_threadsafe(_resolve, future, result, error)
+
+    def _in_session(self, function, *args):
+        # Closing the session rolls back whatever the job did not commit
+        with Session(self.engine) as session:
+            return function(session, *args)
+
+    async def run(self, function, *args):
+        """Runs a function on the worker thread and waits for its result.
+
+        Args:
+            function (Callable): The blocking function to run.
+            *args: Arguments of the function.
+
+        Returns:
+            Any: What the function returned, its exceptions are raised again here.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="kayo-ingest", daemon=True)
+            self.thread.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.jobs.put((loop, future, function, args))
+        return await future
+
+    async def transaction(self, function, *args):
+        """Runs a function on the worker thread with a Session opened for this job only.
+
+        Args:
+            function (Callable): The blocking function to run, called with the Session first.
+            *args: Other arguments of the function.
+
+        Returns:
+            Any: What the function returned, its exceptions are raised again here.
+        """
+        return await self.run(self._in_session, function, *args)
+
+    def stop(self):
+        """Stops the thread once the jobs already queued are done."""
+        if self.thread is not None:
+            self.jobs.put(None)
+            self.thread.join()
+            self.thread = None
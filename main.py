@@ -3,7 +3,6 @@
 Returns:
     _type_: _description_
 """
-import asyncio
 import logging
 import os
 
@@ -12,36 +11,48 @@ from discord.ext import commands
 from discord.ext import tasks
 
 from kayo import instance
+from kayo.alert import create_alerts
 from kayo.alert import create_league_alert
 from kayo.alert import create_team_alert
 from kayo.alert import delete_alert
 from kayo.alert import get_alerts_by_channel_id
-from kayo.alert import get_alerts_league
-from kayo.alert import get_alerts_teams
-from kayo.league import fetch_leagues
+from kayo.alert import load_subscriptions
+from kayo.db import scoped
+from kayo.dispatch import deliver
+from kayo.dispatch import get_deliveries
 from kayo.league import get_league_by_id
 from kayo.league import get_league_by_name
 from kayo.league import get_league_names
 from kayo.league import get_leagues
+from kayo.league import load_league_names
+from kayo.lib import archive_old_matches
 from kayo.lib import fetch_events_and_teams
-from kayo.lib import send_match_alert
 from kayo.match import get_matches
-from kayo.match import get_upcoming_matches
-from kayo.model import Base
+from kayo.match import MATCH_RETENTION_DAYS
+from kayo.migrations import migrate
+from kayo.scheduler import scheduler
 from kayo.team import get_team_by_name
 from kayo.team import get_team_names
 from kayo.team import get_teams
+from kayo.team import load_team_names
 
 
-Base.metadata.create_all(instance.engine)
+migrate(instance.engine)
 
 
 # BOT LOGIC
 @instance.bot.event
 async def on_ready():
     """Executed when the Discord bot boots up."""
-    checkForMatches.start()
-    updateDatabase.start()
+    # on_ready is dispatched again on every reconnection
+    await load_subscriptions()
+    await load_league_names()
+    await load_team_names()
+    scheduler.start()
+    if not updateDatabase.is_running():
+        updateDatabase.start()
+    if MATCH_RETENTION_DAYS > 0 and not archiveMatches.is_running():
+        archiveMatches.start()
 
     logging.info(f"{instance.bot.user} is online! 🚀")
 
@@ -89,6 +100,7 @@ async def ping(ctx):
 
 
 @instance.bot.slash_command(name="list_alerts", description="Lists the alerts on this channel")
+@scoped
 async def list_alerts(ctx):
     """Lists the alerts configured for the current channel.
 
@@ -96,25 +108,25 @@ async def list_alerts(ctx):
         ctx (discord.ApplicationContext): Information about the current message.
     """
     await ctx.respond("Fetching alerts...")
-    list_of_alerts = get_alerts_by_channel_id(ctx.channel_id)
+    list_of_alerts = await get_alerts_by_channel_id(ctx.channel_id)
     league_alerts = [x for x in list_of_alerts if x.league_id is not None]
-    team_alerts = [x for x in list_of_alerts if x.team_name is not None]
+    team_alerts = [x for x in list_of_alerts if x.team_id is not None]
     if not list_of_alerts:
         await ctx.respond("There is no alerts configured for this channel.")
     else:
         if team_alerts:
             answer = "List of team alerts : "
             for alert in team_alerts:
-                if len(f"{answer}\r- {alert.team_name}") > 1500:
+                if len(f"{answer}\r- {alert.teams.name}") > 1500:
                     await ctx.respond(answer)
                     answer = ""
-                answer = f"{answer}\r- {alert.team_name}"
+                answer = f"{answer}\r- {alert.teams.name}"
             await ctx.respond(answer)
 
         if league_alerts:
             answer = "List of league alerts :"
             for alert in league_alerts:
-                league = get_league_by_id(alert.league_id)
+                league = await get_league_by_id(alert.league_id)
                 if len(f"{answer} \r - {league.name}") > 1500:
                     await ctx.respond({answer})
                     answer = ""
@@ -124,11 +136,12 @@ async def list_alerts(ctx):
 
 @instance.subscribe.command(name="league", description="Subscribe to league alerts")
 @commands.has_permissions(manage_messages=True)
+@scoped
 async def subscribe_league(
     ctx: discord.ApplicationContext,
     league: discord.Option(
         discord.SlashCommandOptionType.string,
-        autocomplete=discord.utils.basic_autocomplete(get_league_names),
+        autocomplete=get_league_names,
     ),
 ):
     """Subscribes the channel to a league.
@@ -136,10 +149,10 @@ async def subscribe_league(
     Args:
         ctx (discord.ApplicationContext): Information about the current message.
         league (discord.Option): Name of the League to follow.
-        Defaults to discord.utils.basic_autocomplete(get_league_names)).
+        Defaults to get_league_names).
     """
     try:
-        alert = create_league_alert(get_league_by_name(league), ctx.channel_id)
+        alert = await create_league_alert(await get_league_by_name(league), ctx.channel_id)
         instance.logger.info(f"Created alert {str(alert)}")
         await ctx.respond(f"Successfully created an alert for {league} !")
     except discord.ext.commands.errors.MissingPermissions:
@@ -148,11 +161,12 @@ async def subscribe_league(
 
 @instance.subscribe.command(name="team", description="Subscribe to team alerts")
 @commands.has_permissions(manage_messages=True)
+@scoped
 async def subscribe_team(
     ctx: discord.ApplicationContext,
     team: discord.Option(
         discord.SlashCommandOptionType.string,
-        autocomplete=discord.utils.basic_autocomplete(get_team_names),
+        autocomplete=get_team_names,
     ),
 ):
     """Subscribe the Discord channel to a Team.
@@ -160,10 +174,10 @@ async def subscribe_team(
     Args:
         ctx (discord.ApplicationContext): Information about the current message.
         team (discord.Option, optional): Autocomplete.
-        Defaults to discord.utils.basic_autocomplete(get_league_names) ).
+        Defaults to get_league_names ).
     """
     try:
-        alert = create_team_alert(get_team_by_name(team), ctx.channel_id)
+        alert = await create_team_alert(await get_team_by_name(team), ctx.channel_id)
         instance.logger.info(f"Created alert {str(alert)}")
         await ctx.respond(f"Successfully created an alert for {team} !")
     except discord.ext.commands.errors.MissingPermissions:
@@ -172,11 +186,12 @@ async def subscribe_team(
 
 @instance.unsubscribe.command(name="league", description="Delete a league alert for this channel")
 @commands.has_permissions(manage_messages=True)
+@scoped
 async def unsubscribe_league(
     ctx: discord.ApplicationContext,
     league: discord.Option(
         discord.SlashCommandOptionType.string,
-        autocomplete=discord.utils.basic_autocomplete(get_league_names),
+        autocomplete=get_league_names,
     ),
 ):
     """Subscribes the channel to a league.
@@ -184,11 +199,10 @@ async def unsubscribe_league(
     Args:
         ctx (discord.ApplicationContext): Information about the current message.
         league (discord.Option): Name of the League to follow.
-        Defaults to discord.utils.basic_autocomplete(get_league_names)).
+        Defaults to get_league_names).
     """
     try:
-        league_obj = [x for x in get_leagues() if x.name == league][0]
-        delete_alert(ctx.channel_id, league=league_obj)
+        await delete_alert(ctx.channel_id, league=await get_league_by_name(league))
         await ctx.respond(f"Successfully deleted an alert for {league} !")
     except discord.ext.commands.errors.MissingPermissions:
         await ctx.respond("You need to have the 'Manage Messages' permission to run this command in a server. Feel free to send me a DM !")
@@ -196,11 +210,12 @@ async def unsubscribe_league(
 
 @instance.unsubscribe.command(name="team", description="Delete a team alert for this channel")
 @commands.has_permissions(manage_messages=True)
+@scoped
 async def unsubscribe_team(
     ctx: discord.ApplicationContext,
     team: discord.Option(
         discord.SlashCommandOptionType.string,
-        autocomplete=discord.utils.basic_autocomplete(get_team_names),
+        autocomplete=get_team_names,
     ),
 ):
     """Subscribe the Discord channel to a Team.
@@ -208,11 +223,10 @@ async def unsubscribe_team(
     Args:
         ctx (discord.ApplicationContext): Information about the current message.
         team (discord.Option, optional): Autocomplete.
-        Defaults to discord.utils.basic_autocomplete(get_league_names) ).
+        Defaults to get_league_names ).
     """
     try:
-        team_obj = [x for x in get_teams() if x.name == team][0]
-        delete_alert(ctx.channel_id, team=team_obj)
+        await delete_alert(ctx.channel_id, team=await get_team_by_name(team))
         await ctx.respond(f"Successfully deleted an alert for {team} !")
     except discord.ext.commands.errors.MissingPermissions:
         await ctx.respond("You need to have the 'Manage Messages' permission to run this command in a server. Feel free to send me a DM !")
@@ -220,6 +234,7 @@ async def unsubscribe_team(
 
 @instance.subscribe.command(name="all_leagues", description="Subscribe to league alerts")
 @commands.has_permissions(manage_messages=True)
+@scoped
 async def subscribe_all_leagues(ctx: discord.ApplicationContext):
     """Subscribe the channel to all the different leagues.
 
@@ -228,8 +243,7 @@ async def subscribe_all_leagues(ctx: discord.ApplicationContext):
     """
     instance.logger.info('Creating alert...')
     try:
-        for league in get_leagues():
-            create_league_alert(league, ctx.channel_id)
+        await create_alerts(ctx.channel_id, leagues=await get_leagues())
         await ctx.respond("Subscribed to all the different leagues !")
     except discord.ext.commands.errors.MissingPermissions as e:
         instance.logger.error(str(e))
@@ -253,36 +267,32 @@ async def on_application_command_error(ctx: discord.ApplicationContext, error: d
         raise error  # Here we raise other errors to ensure they aren't ignored
 
 
-@tasks.loop(seconds=300)
-async def checkForMatches(prepared_matches=None):
-    """Checks if there is new upcoming matches."""
-    instance.logger.info("Checking for alerts to send...")
-    if prepared_matches is None:
-        prepared_matches = get_upcoming_matches()
-    async with asyncio.TaskGroup() as tg:
-        for match in prepared_matches:
-            try:
-                team_alerts = get_alerts_teams(match.team_a, match.team_b)
-                league_alerts = get_alerts_league(match.league)
-                for alert in team_alerts:
-                    tg.create_task(send_match_alert(alert.channel_id, match))
-                for alert in league_alerts:
-                    tg.create_task(send_match_alert(alert.channel_id, match))
-            except* Exception as ex:
-                instance.logger.exception(f'Got an exception while handling alerts : {ex}')
-        instance.logger.info('Finished updating Matches and Teams !')
-
-
 @tasks.loop(minutes=30)
+@scoped
 async def updateDatabase():
     """Checks if there is new upcoming matches."""
     instance.logger.info("Updating the database periodically...")
-    fetch_leagues()
-    await fetch_events_and_teams()
+    # An exception escaping a loop would stop it until the bot restarts
+    try:
+        changes = await fetch_events_and_teams()
+        scheduler.update(changes["matches"])
+    except Exception as e:
+        instance.logger.exception(f'Got an exception while updating the database : {e}')
+
+
+@tasks.loop(hours=6)
+@scoped
+async def archiveMatches():
+    """Moves the old matches out of the matches table."""
+    try:
+        await archive_old_matches()
+    except Exception as e:
+        instance.logger.exception(f'Got an exception while archiving matches : {e}')
 
 if os.environ.get('DEPLOYED').upper() != "PRODUCTION":
     @instance.bot.slash_command(name="debug_alert", description="DO NOT USE ON YOUR SERVER !")
     @commands.has_permissions(manage_roles=True, ban_members=True)
+    @scoped
     async def debug_alerts(ctx):
         """Sends a shit ton of alerts for debugging the format.
 
@@ -290,12 +300,13 @@ if os.environ.get('DEPLOYED').upper() != "PRODUCTION":
             ctx (discord.ApplicationContext): Information about the current message.
         """
         try:
-            await checkForMatches(prepared_matches=sorted(get_matches(), key=lambda x: x.startTime, reverse=True)[0:10])
+            await deliver(await get_deliveries([match.id for match in await get_matches(limit=10)]), ledger=False)
         except discord.ext.commands.errors.MissingPermissions as e:
             instance.logger.error(str(e))
 
     @instance.subscribe.command(name="all_teams", description="Subscribe to team alerts")
     @commands.has_permissions(manage_roles=True, ban_members=True)
+    @scoped
     async def subscribe_all_teams(ctx: discord.ApplicationContext):
         """Subscribe the channel to all the different leagues.
 
@@ -305,8 +316,7 @@ if os.environ.get('DEPLOYED').upper() != "PRODUCTION":
         instance.logger.info('Creating alert...')
         try:
             await ctx.respond("Subscribing you to all teams...")
-            for team in get_teams():
-                create_team_alert(team, ctx.channel_id)
+            await create_alerts(ctx.channel_id, teams=await get_teams())
             await ctx.respond("Subscribed to all the different teams !")
         except discord.ext.commands.errors.MissingPermissions as e:
             instance.logger.error(str(e))
@@ -0,0 +1,33 @@
+"""Configures KAY/O for the tests, before the kayo package is imported."""
+import json
+import os
+
+import pytest
+
+os.environ.setdefault("LOGLEVEL", "WARNING")
+os.environ.setdefault("DEPLOYED", "test")
+os.environ.setdefault("DEBUG_GUILD", "0")
+
+
+@pytest.fixture
+def schedule_page():
+    """Builds the bodies of getSchedule responses.
+
+    Returns:
+        Callable: Takes the identifier and start time of each match, and the page tokens, returns the raw body.
+    """
+    def build(*matches, older=None, newer=None):
+        events = [
+            {
+                "startTime": start_time,
+                "blockName": "Week 1",
+                "match": {
+                    "id": match_id,
+                    "teams": [{"name": "FNATIC", "image": "http://fnatic"}, {"name": "NAVI", "image": "http://navi"}],
+                    "strategy": {"type": "bestOf", "count": 3},
+                },
+            }
+            for match_id, start_time in matches
+        ]
+        return json.dumps({"data": {"schedule": {"pages": {"older": older, "newer": newer}, "events": events}}}).encode()
+    return build
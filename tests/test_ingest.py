@@ -0,0 +1,73 @@
+"""Tests of the writes of a refresh."""
+from sqlalchemy.orm import Session
+
+import kayo.alert  # noqa: F401 registers the Alert mapper
+from kayo import instance
+from kayo.cache import ResponseCache
+from kayo.ingest import parse_schedule_page
+from kayo.ingest import RefreshBatch
+from kayo.ingest import stale_matches
+from kayo.ingest import store_batch
+from kayo.league import League
+from kayo.league import upsert_leagues
+from kayo.migrations import migrate
+
+LEAGUE_ID = 7
+
+
+def refresh(cache, pages):
+    """Parses and stores pages of a schedule like a refresh does.
+
+    Args:
+        cache (ResponseCache): The responses of the previous refreshes.
+        pages (dict[str, bytes]): Raw bodies of the pages that changed, by cache key.
+
+    Returns:
+        ChangeSet: The changes of the matches.
+    """
+    batch = RefreshBatch()
+    for key, body in pages.items():
+        batch.responses[key] = ({}, body, parse_schedule_page(LEAGUE_ID, body, batch))
+    batch.stale = stale_matches(batch, cache)
+    with Session(instance.engine) as session:
+        changes = store_batch(session, batch)["matches"]
+    for key, (headers, body, meta) in batch.responses.items():
+        cache.store(key, headers, body, meta=meta)
+    return changes
+
+
+def stored_matches():
+    """Gets the stored matches of the League and their ledger entries.
+
+    Returns:
+        tuple[list[int], list[int]]: Ids of the matches, and of the matches with a ledger entry.
+    """
+    with instance.engine.connect() as connection:
+        matches = connection.exec_driver_sql("SELECT id FROM matches WHERE league_id = ? ORDER BY id", (LEAGUE_ID,)).scalars().all()
+        ledger = connection.exec_driver_sql("SELECT match_id FROM deliveries WHERE match_id IN (1, 2, 3, 4) ORDER BY match_id").scalars().all()
+    return matches, ledger
+
+
+def test_only_the_page_a_match_was_last_seen_on_removes_it(schedule_page):
+    """A match of an older page starting with the first event of a changed page is kept.
+
+    The matches are in the past, so the scheduler tests do not pick them up.
+    """
+    migrate(instance.engine)
+    with Session(instance.engine) as session:
+        upsert_leagues(session, [League(id=LEAGUE_ID, name="VCT Pacific", slug="vct_pacific", region="AP", image="http://pacific")])
+        session.commit()
+    cache = ResponseCache()
+    first, older = str(LEAGUE_ID), f"{LEAGUE_ID}:o1"
+    refresh(cache, {
+        first: schedule_page(("3", "2000-01-02T10:00:00Z"), ("4", "2000-01-03T10:00:00Z"), older="o1"),
+        older: schedule_page(("1", "2000-01-01T10:00:00Z"), ("2", "2000-01-02T10:00:00Z")),
+    })
+    with instance.engine.begin() as connection:
+        connection.exec_driver_sql("INSERT INTO deliveries VALUES (2, 42, 946807200, 'sent', 1, 0), (4, 42, 946893600, 'sent', 1, 0)")
+
+    # Match 4 is removed from the first page, the older page is not fetched again
+    changes = refresh(cache, {first: schedule_page(("3", "2000-01-02T10:00:00Z"), older="o1")})
+
+    assert changes.deleted == [4]
+    assert stored_matches() == ([1, 2, 3], [2])
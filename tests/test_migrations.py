@@ -0,0 +1,86 @@
+"""Tests of the schema migrations."""
+import calendar
+
+from sqlalchemy import create_engine
+
+from kayo.migrations import migrate
+from kayo.migrations import MIGRATIONS
+
+# The schema created by the first release, before any migration
+BASELINE_SCHEMA = [
+    """
+    CREATE TABLE leagues (
+        id INTEGER NOT NULL,
+        name VARCHAR(60) NOT NULL,
+        slug VARCHAR(60) NOT NULL,
+        region VARCHAR(60) NOT NULL,
+        image VARCHAR(500) NOT NULL,
+        PRIMARY KEY (id),
+        UNIQUE (slug)
+    )
+    """,
+    """
+    CREATE TABLE teams (
+        name VARCHAR(60) NOT NULL,
+        image VARCHAR(500) NOT NULL,
+        PRIMARY KEY (name)
+    )
+    """,
+    """
+    CREATE TABLE matches (
+        id INTEGER NOT NULL,
+        league_id INTEGER,
+        "startTime" DATETIME NOT NULL,
+        bo_count VARCHAR(60) NOT NULL,
+        "blockName" VARCHAR(60) NOT NULL,
+        team_a VARCHAR(60) NOT NULL,
+        team_b VARCHAR(60) NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(league_id) REFERENCES leagues (id),
+        FOREIGN KEY(team_a) REFERENCES teams (name),
+        FOREIGN KEY(team_b) REFERENCES teams (name)
+    )
+    """,
+    """
+    CREATE TABLE alerts (
+        id INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        league_id INTEGER,
+        team_name VARCHAR(60),
+        PRIMARY KEY (id),
+        CONSTRAINT channel_league_alert_uc UNIQUE (channel_id, league_id),
+        CONSTRAINT channel_team_alert_uc UNIQUE (channel_id, team_name),
+        FOREIGN KEY(league_id) REFERENCES leagues (id),
+        FOREIGN KEY(team_name) REFERENCES teams (name)
+    )
+    """,
+    "INSERT INTO leagues VALUES (1, 'VCT EMEA', 'vct_emea', 'EMEA', 'http://emea')",
+    "INSERT INTO teams VALUES ('NAVI', 'http://navi'), ('FNATIC', 'http://fnatic')",
+    "INSERT INTO matches VALUES (101, 1, '2030-01-01 10:00:00.000000', '3', 'Week 1', 'FNATIC', 'NAVI')",
+    "INSERT INTO alerts VALUES (1, 42, 1, NULL), (2, 42, NULL, 'NAVI')",
+]
+
+
+def test_migrate_a_baseline_database(tmp_path):
+    """A database created by the first release is brought to the latest schema with its rows."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'kayo.db'}")
+    with engine.begin() as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.exec_driver_sql(statement)
+
+    migrate(engine)
+
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA user_version").scalar() == len(MIGRATIONS)
+        teams = dict(connection.exec_driver_sql("SELECT name, id FROM teams").all())
+        assert sorted(teams) == ["FNATIC", "NAVI"]
+        assert connection.exec_driver_sql('SELECT id, league_id, "startTime", bo_count, team_a_id, team_b_id FROM matches').all() == [
+            (101, 1, calendar.timegm((2030, 1, 1, 10, 0, 0)), 3, teams["FNATIC"], teams["NAVI"])
+        ]
+        assert connection.exec_driver_sql("SELECT id, channel_id, league_id, team_id FROM alerts ORDER BY id").all() == [
+            (1, 42, 1, None),
+            (2, 42, None, teams["NAVI"]),
+        ]
+        tables = {name for name, in connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert {"matches_archive", "deliveries", "schedule_cursors"} <= tables
+    engine.dispose()
@@ -0,0 +1,39 @@
+"""Tests of the delivery queue of the alerts."""
+import asyncio
+
+import discord
+
+from kayo.outbox import DeliveryQueue
+
+
+class Response:
+    """The part of an aiohttp response read by discord.HTTPException."""
+
+    def __init__(self, status):
+        """Creates a response with no headers."""
+        self.status = status
+        self.reason = "Not Found"
+        self.headers = {}
+
+
+def test_refusals_count_once_per_dispatch():
+    """A channel refusing several messages of the same dispatch is only one step closer to being pruned."""
+    async def send(channel_id, payload):
+        if channel_id == 43:
+            raise discord.NotFound(Response(404), "Unknown Channel")
+
+    async def dispatch(queue):
+        return await queue.submit([(42, "a"), (43, "b"), (43, "c")])
+
+    async def dispatch_twice():
+        queue = DeliveryQueue(send, rate=1000, channel_rate=1000, channel_burst=10)
+        try:
+            assert await dispatch(queue) == [True, False, False]
+            assert queue.unreachable == {43: 1}
+            assert queue.dead_channels(2) == []
+            await dispatch(queue)
+            assert queue.dead_channels(2) == [43]
+        finally:
+            await queue.close()
+
+    asyncio.run(dispatch_twice())
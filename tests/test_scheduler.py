@@ -0,0 +1,96 @@
+"""Tests of the scheduler of the alerts."""
+import asyncio
+import calendar
+import time
+
+from sqlalchemy.orm import Session
+
+import kayo.alert  # noqa: F401 registers the Alert mapper
+from kayo import instance
+from kayo.ingest import parse_schedule_page
+from kayo.ingest import RefreshBatch
+from kayo.ingest import store_batch
+from kayo.league import League
+from kayo.league import upsert_leagues
+from kayo.migrations import migrate
+from kayo.scheduler import AlertScheduler
+
+
+def store_page(body):
+    """Parses and stores a page of the schedule of a League.
+
+    Args:
+        body (bytes): The raw body of the page.
+
+    Returns:
+        ChangeSet: The changes of the matches.
+    """
+    batch = RefreshBatch()
+    parse_schedule_page(1, body, batch)
+    with Session(instance.engine) as session:
+        return store_batch(session, batch)["matches"]
+
+
+def epoch(date):
+    """Converts a date of the Riot API to a UTC epoch.
+
+    Args:
+        date (str): The date.
+
+    Returns:
+        int: The UTC epoch.
+    """
+    return calendar.timegm(time.strptime(date, "%Y-%m-%dT%H:%M:%SZ"))
+
+
+def test_update_replaces_the_matches_loaded_from_the_database(schedule_page):
+    """A Match postponed by the API is only alerted at its new start time."""
+    migrate(instance.engine)
+    with Session(instance.engine) as session:
+        upsert_leagues(session, [League(id=1, name="VCT EMEA", slug="vct_emea", region="EMEA", image="http://emea")])
+        session.commit()
+    store_page(schedule_page(("101", "2100-01-01T10:00:00Z"), ("102", "2100-01-02T10:00:00Z")))
+
+    async def postpone():
+        scheduler = AlertScheduler(lead_time=300)
+        task = asyncio.create_task(scheduler.run())
+        while len(scheduler) < 2:
+            await asyncio.sleep(0.01)
+        # Both matches end up due at the same time
+        scheduler.update(store_page(schedule_page(("101", "2100-01-02T10:00:00Z"), ("102", "2100-01-02T10:00:00Z"))))
+        task.cancel()
+        return scheduler
+
+    scheduler = asyncio.run(postpone())
+    start_time = epoch("2100-01-02T10:00:00Z")
+    assert scheduler.start_times == {101: start_time, 102: start_time}
+    assert scheduler.pop_due(epoch("2100-01-01T10:00:00Z")) == []
+    assert sorted(scheduler.pop_due(start_time - 300)) == [(101, start_time), (102, start_time)]
+
+
+def test_run_retries_the_alerts_when_sending_fails(monkeypatch):
+    """Matches popped from the heap are scheduled again when their alerts cannot be sent."""
+    start_time = int(time.time()) + 3600
+
+    async def get_start_times(after):
+        return {101: start_time}
+
+    async def fire(due):
+        raise OSError("database is locked")
+
+    monkeypatch.setattr("kayo.scheduler.get_start_times", get_start_times)
+
+    async def fail():
+        scheduler = AlertScheduler(lead_time=3600)
+        monkeypatch.setattr(scheduler, "fire", fire)
+        task = asyncio.create_task(scheduler.run())
+        for _ in range(100):
+            if 101 in scheduler.start_times and scheduler.heap[0][0] > start_time - 3600:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        return scheduler
+
+    scheduler = asyncio.run(fail())
+    assert scheduler.start_times == {101: start_time}
+    assert scheduler.heap[0][0] > start_time - 3600